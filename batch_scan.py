@@ -0,0 +1,239 @@
+import argparse
+import heapq
+import json
+import os
+import sys
+import time
+from class_hierarchy import ClassHierarchy
+from clone_detection import CloneIndex
+from code_smells_detection import DETECTOR_VERSION, CodeSmellDetector, clone_finding, hierarchy_findings, iter_analyzed, iter_cached, skipped_findings
+
+# Where the shared result cache of a batch lives unless --cache-dir says otherwise
+DEFAULT_CACHE_DIR = '.smellcache'
+
+# A nightly batch touches far more files than one repository, so its cache is allowed to grow larger
+DEFAULT_CACHE_MB = 1024
+
+
+def load_manifest(path):
+    """Read the repositories to scan as (name, root) pairs.
+
+    A .json manifest is a list of paths or of {"name": ..., "path": ...} objects; any other file has
+    one path per line, with # comments. Relative paths are taken from the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding='utf-8') as file:
+        if path.endswith('.json'):
+            entries = json.load(file)
+        else:
+            entries = [line.strip() for line in file]
+            entries = [entry for entry in entries if entry and not entry.startswith('#')]
+
+    repositories = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        root = os.path.join(base, os.path.expanduser(entry['path']))
+        repositories.append((entry.get('name') or os.path.basename(os.path.normpath(root)), os.path.normpath(root)))
+    return repositories
+
+
+class RepositoryStats:
+    """Counts of one repository, filled in as its findings stream past."""
+
+    def __init__(self, name, root, top, keep_findings):
+        self.name = name
+        self.root = root
+        self.top = top
+        self.files = 0
+        self.smells = 0
+        self.rules = {}
+        self.file_smells = []
+        self.findings = [] if keep_findings else None
+        self.error = None if os.path.isdir(root) else "not a directory"
+
+    def add_file(self, file_path, findings):
+        self.files += 1
+        self.add_findings(findings)
+        # Only the files with the most findings are kept
+        entry = (len(findings), os.path.relpath(file_path, self.root))
+        if len(self.file_smells) < self.top:
+            heapq.heappush(self.file_smells, entry)
+        elif entry > self.file_smells[0]:
+            heapq.heapreplace(self.file_smells, entry)
+
+    def add_findings(self, findings):
+        self.smells += len(findings)
+        for finding in findings:
+            self.rules[finding.rule] = self.rules.get(finding.rule, 0) + 1
+        if self.findings is not None:
+            self.findings.extend(finding.to_json() for finding in findings)
+
+    def top_files(self):
+        return [{'path': path, 'smells': smells} for smells, path in sorted(self.file_smells, reverse=True) if smells]
+
+    def to_json(self):
+        report = {
+            'name': self.name,
+            'path': self.root,
+            'files': self.files,
+            'smells': self.smells,
+            'rules': dict(sorted(self.rules.items())),
+            'top_files': self.top_files(),
+        }
+        if self.error is not None:
+            report['error'] = self.error
+        if self.findings is not None:
+            report['findings'] = self.findings
+        return report
+
+
+class BatchScanner:
+    """Scans many repositories in one run, one result cache and one worker pool."""
+
+    def __init__(self, repositories, jobs=0, use_cache=True, cache_dir=DEFAULT_CACHE_DIR,
+                 cache_max_bytes=DEFAULT_CACHE_MB * 1024 * 1024, top=10, keep_findings=False):
+        self.stats = [RepositoryStats(name, root, top, keep_findings) for name, root in repositories]
+        # Each repository is analyzed with the rules, thresholds and AST budgets of its own pyproject.toml
+        self.detectors = []
+        for stats in self.stats:
+            detector = None
+            if stats.error is None:
+                try:
+                    detector = CodeSmellDetector.from_config(stats.root, use_cache=use_cache, cache_dir=cache_dir)
+                except (OSError, ValueError) as e:
+                    stats.error = f"invalid configuration: {e}"
+            self.detectors.append(detector)
+        # Number of worker processes shared by all repositories; 0 means one per CPU
+        self.jobs = jobs or os.cpu_count() or 1
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.top = top
+
+    def scan(self, progress=None):
+        """Scan every repository and return the combined report as a dict."""
+        start = time.perf_counter()
+        if progress is not None:
+            for stats in self.stats:
+                if stats.error is not None:
+                    progress(stats)
+
+        # Repositories whose settings analyze files the same way are analyzed by one detector, and the files
+        # of all repositories go through one pool, which stays busy across their boundaries
+        configs = {}
+        for detector in self.detectors:
+            if detector is not None:
+                configs.setdefault(detector.config_key(), detector)
+        config_indexes = {config_key: index for index, config_key in enumerate(configs)}
+
+        repositories = [(index, list(detector.find_python_files())) for index, detector in enumerate(self.detectors)
+                        if detector is not None]
+        tasks = [(config_indexes[self.detectors[index].config_key()], file_path)
+                 for index, file_paths in repositories for file_path in file_paths]
+        results = self.iter_file_results(list(configs.values()), tasks)
+        for index, file_paths in repositories:
+            self.scan_repository(self.detectors[index], self.stats[index], file_paths, results, progress)
+        # Run the results to their end, so the caches are saved and closed now
+        next(results, None)
+
+        return self.report(time.perf_counter() - start)
+
+    def iter_file_results(self, detectors, tasks):
+        """Yield the FileResult of every (detector index, path) task in order; only files not in the cache are analyzed."""
+        cache = None
+        if self.use_cache:
+            from smell_cache import open_cache
+            cache = open_cache(self.cache_dir, '', self.cache_max_bytes)
+        if cache is None:
+            yield from iter_analyzed(detectors, tasks, self.jobs)
+            return
+
+        # One connection serves every configuration, with each file keyed by the settings it is analyzed with
+        with cache:
+            try:
+                keys = [cache.key(file_path, detectors[index].config_key()) for index, file_path in tasks]
+                hits = [key is not None and cache.contains(key) for key in keys]
+                analyzed = iter_analyzed(detectors, [task for task, hit in zip(tasks, hits) if not hit], self.jobs)
+                yield from iter_cached(cache, keys, hits, analyzed)
+            finally:
+                for detector in detectors:
+                    detector.save_units()
+
+    def scan_repository(self, detector, stats, file_paths, results, progress):
+        stats.add_findings(skipped_findings(detector.file_finder))
+        clone_index = CloneIndex()
+        hierarchy = ClassHierarchy(stats.root)
+        for file_path in file_paths:
+            result = next(results)
+            clone_index.add(file_path, result.fingerprints)
+            hierarchy.update(file_path, result.classes)
+            stats.add_file(file_path, result.findings)
+
+        # Class hierarchies and clones are only followed within a repository
+        stats.add_findings(hierarchy_findings(hierarchy, detector.rules.thresholds))
+        stats.add_findings([clone_finding(clone) for clone in clone_index.find_clones()])
+        if progress is not None:
+            progress(stats)
+
+    def report(self, seconds):
+        rules = {}
+        for stats in self.stats:
+            for rule, count in stats.rules.items():
+                rules[rule] = rules.get(rule, 0) + count
+
+        top_files = heapq.nlargest(self.top, (
+            (smells, stats.name, path) for stats in self.stats for smells, path in stats.file_smells if smells
+        ))
+        top_repositories = heapq.nlargest(self.top, ((stats.smells, stats.name) for stats in self.stats if stats.smells))
+
+        return {
+            'detector_version': DETECTOR_VERSION,
+            'seconds': round(seconds, 3),
+            'totals': {
+                'repositories': len(self.stats),
+                'files': sum(stats.files for stats in self.stats),
+                'smells': sum(stats.smells for stats in self.stats),
+                'rules': dict(sorted(rules.items())),
+                'top_files': [{'repository': name, 'path': path, 'smells': smells} for smells, name, path in top_files],
+                'top_repositories': [{'name': name, 'smells': smells} for smells, name in top_repositories],
+            },
+            'repositories': [stats.to_json() for stats in self.stats],
+        }
+
+
+def print_progress(stats):
+    status = f"error: {stats.error}" if stats.error else f"{stats.smells} smells in {stats.files} files"
+    print(f"{stats.name}: {status}", file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan every repository of a manifest and write one combined JSON report.")
+    parser.add_argument("manifest", help="file with one repository path per line, or a .json list")
+    parser.add_argument("-o", "--output", help="write the report to OUTPUT instead of stdout")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="worker processes shared by all repositories, 0 for one per CPU (default: 0)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"result cache shared by all repositories (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_MB, metavar="MB", help=f"size limit of the cache (default: {DEFAULT_CACHE_MB})")
+    parser.add_argument("--no-cache", action="store_true", help="analyze every file instead of reusing cached results")
+    parser.add_argument("--top", type=int, default=10, metavar="N", help="number of top offenders to report (default: 10)")
+    parser.add_argument("--findings", action="store_true", help="include every finding in the report")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not print a line per repository to stderr")
+    args = parser.parse_args()
+
+    scanner = BatchScanner(
+        load_manifest(args.manifest), jobs=args.jobs, use_cache=not args.no_cache, cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_size * 1024 * 1024, top=args.top, keep_findings=args.findings,
+    )
+    report = scanner.scan(None if args.quiet else print_progress)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
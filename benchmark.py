@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from code_smells_detection import CodeSmellDetector, FileContext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Corpus sizes the benchmark is usually run at
+CORPUS_SIZES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+# Files per generated package directory
+FILES_PER_PACKAGE = 100
+
+# A regression is reported when a measurement gets this much worse than the baseline
+DEFAULT_TOLERANCE = 0.10
+
+# A pre-commit hook on one small file should take no more than this on top of starting a bare interpreter.
+# Parsing the file needs ast and tokenize, and the command line argparse, which alone take about 20 ms
+STARTUP_TARGET_MS = 50
+
+SMALL_FILE = "def handler(event):\n    return event.body\n"
+
+
+class CorpusGenerator:
+    """Writes a deterministic synthetic Python code base; the same seed and knobs always give the same files."""
+
+    def __init__(self, seed=0, classes=3, methods=8, depth=3, duplication=0.1):
+        self.random = random.Random(seed)
+        self.classes = classes
+        self.methods = methods
+        self.depth = depth
+        self.duplication = duplication
+        # Function bodies shared between files, so the clone detector has something to find
+        self.shared_functions = [self.function(f"shared_{i}", 0) for i in range(20)]
+
+    def generate(self, directory, files):
+        for index in range(files):
+            package = os.path.join(directory, f"pkg_{index // FILES_PER_PACKAGE:04d}")
+            os.makedirs(package, exist_ok=True)
+            with open(os.path.join(package, f"module_{index:06d}.py"), 'w', encoding='utf-8') as file:
+                file.write(self.module(index))
+
+    def module(self, index):
+        rand = self.random
+        parts = [f"import os\nimport sys\nfrom collections import defaultdict\n\nLIMIT_{index} = {rand.randint(10, 99)}\n"]
+
+        for class_index in range(self.classes):
+            parts.append(self.class_source(f"Generated{index}_{class_index}"))
+
+        for function_index in range(2):
+            if rand.random() < self.duplication:
+                parts.append(rand.choice(self.shared_functions))
+            else:
+                parts.append(self.function(f"helper_{function_index}", 0))
+
+        return "\n\n".join(parts) + "\n"
+
+    def class_source(self, name):
+        rand = self.random
+        bases = ", ".join(f"Base{i}" for i in range(rand.randint(0, 4)))
+        lines = [f"class {name}({bases}):" if bases else f"class {name}:"]
+        for i in range(rand.randint(0, 3)):
+            lines.append(f"    _field_{i} = {rand.randint(0, 500)}")
+        source = "\n".join(lines) + "\n"
+
+        for method_index in range(self.methods):
+            source += "\n" + self.function(f"method_{method_index}", 1, method=True)
+        return source
+
+    def function(self, name, indent, method=False):
+        rand = self.random
+        pad = "    " * indent
+        params = ", ".join(f"arg{i}" for i in range(rand.randint(1, 7)))
+        params = f"self, {params}" if method else params
+        lines = [f"{pad}def {name}({params}):", f"{pad}    # {rand.choice(['setup', 'main loop', 'cleanup'])}"]
+        lines.extend(self.block(indent + 1, self.depth))
+        lines.append(f"{pad}    return {'self.total' if method else 'arg0'}")
+        return "\n".join(lines) + "\n"
+
+    def block(self, indent, depth):
+        rand = self.random
+        pad = "    " * indent
+        lines = [f"{pad}total = other.value + {rand.randint(2, 1000)}"]
+        if depth > 0:
+            kind = rand.choice(['for', 'if', 'while'])
+            if kind == 'for':
+                lines.append(f"{pad}for item in range({rand.randint(2, 50)}):")
+            elif kind == 'if':
+                lines.append(f"{pad}if total > {rand.randint(2, 50)} and other.flag:")
+            else:
+                lines.append(f"{pad}while total < {rand.randint(2, 50)}:")
+            lines.extend(self.block(indent + 1, depth - 1))
+            if kind == 'while':
+                lines.append(f"{pad}    total += 1")
+        if rand.random() < 0.2:
+            lines.append(f"{pad}message = 'a deliberately long line that goes past the eighty character limit of the long line rule'")
+        return lines
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def count_lines(file_paths):
+    total = 0
+    for file_path in file_paths:
+        with open(file_path, 'rb') as file:
+            total += file.read().count(b'\n')
+    return total
+
+
+def check_names():
+    return sorted(name for name in dir(CodeSmellDetector) if name.startswith('check_'))
+
+
+def benchmark_scan(directory, jobs):
+    detector = CodeSmellDetector(directory, jobs=jobs)
+    start = time.perf_counter()
+    for finding in detector.iter_smells():
+        pass
+    return time.perf_counter() - start, detector.get_smells_count()
+
+
+def benchmark_rules(directory):
+    """Time reading/parsing, tokenizing and every check_* method on its own, summed over all files."""
+    detector = CodeSmellDetector(directory)
+    timings = {'parse': 0.0, 'tokenize': 0.0}
+    timings.update((name, 0.0) for name in check_names())
+    checks = [(name, getattr(detector, name)) for name in check_names()]
+
+    for file_path in detector.find_python_files():
+        start = time.perf_counter()
+        try:
+            context = FileContext.from_path(file_path)
+            context.tree
+        except (SyntaxError, ValueError):
+            continue
+        timings['parse'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        context.tokens
+        timings['tokenize'] += time.perf_counter() - start
+
+        for name, check in checks:
+            start = time.perf_counter()
+            check(context)
+            timings[name] += time.perf_counter() - start
+
+    return timings
+
+
+def benchmark_startup(runs=20):
+    """(command line on one small file, bare interpreter) median wall times in milliseconds, from process start to exit."""
+    package = os.path.dirname(os.path.abspath(__file__))
+    # The first run compiles the bytecode caches, which every later run on a developer machine reuses,
+    # so they are written even where PYTHONDONTWRITEBYTECODE is set
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'small.py')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(SMALL_FILE)
+        command = [sys.executable, '-m', 'code_smells_detection', '--no-cache', path]
+        subprocess.run(command, cwd=package, env=env, stdout=subprocess.DEVNULL, check=True)
+        return median_run_ms(command, package, env, runs), median_run_ms([sys.executable, '-c', 'pass'], package, env, runs)
+
+
+def median_run_ms(command, cwd, env, runs):
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, check=True)
+        seconds.append(time.perf_counter() - start)
+    return statistics.median(seconds) * 1000
+
+
+def run_benchmark(directory, jobs=1):
+    file_paths = list(CodeSmellDetector(directory).find_python_files())
+    lines = count_lines(file_paths)
+    scan_seconds, findings = benchmark_scan(directory, jobs)
+    rule_seconds = benchmark_rules(directory)
+    startup_ms, interpreter_ms = benchmark_startup()
+
+    return {
+        'corpus': os.path.abspath(directory),
+        'python': platform.python_version(),
+        'jobs': jobs,
+        'files': len(file_paths),
+        'lines': lines,
+        'findings': findings,
+        'scan_seconds': scan_seconds,
+        'files_per_second': len(file_paths) / scan_seconds if scan_seconds else 0.0,
+        'lines_per_second': lines / scan_seconds if scan_seconds else 0.0,
+        'peak_rss_kb': peak_rss_kb(),
+        'startup_ms': startup_ms,
+        'interpreter_ms': interpreter_ms,
+        'rule_seconds': rule_seconds,
+    }
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Return a line per measurement that got worse than the baseline by more than tolerance."""
+    regressions = []
+
+    # Throughput: higher is better
+    for key in ('files_per_second', 'lines_per_second'):
+        if baseline.get(key) and results[key] < baseline[key] * (1 - tolerance):
+            regressions.append(f"{key}: {results[key]:.1f} vs baseline {baseline[key]:.1f}")
+
+    if baseline.get('startup_ms') and results.get('startup_ms') and results['startup_ms'] > baseline['startup_ms'] * (1 + tolerance):
+        regressions.append(f"startup_ms: {results['startup_ms']:.1f} vs baseline {baseline['startup_ms']:.1f}")
+
+    if baseline.get('peak_rss_kb') and results['peak_rss_kb'] and results['peak_rss_kb'] > baseline['peak_rss_kb'] * (1 + tolerance):
+        regressions.append(f"peak_rss_kb: {results['peak_rss_kb']} vs baseline {baseline['peak_rss_kb']}")
+
+    # Per-rule times are compared per file, so baselines from a different corpus size still apply
+    for rule, seconds in results['rule_seconds'].items():
+        base_seconds = baseline.get('rule_seconds', {}).get(rule)
+        if not base_seconds or not results['files'] or not baseline.get('files'):
+            continue
+        per_file = seconds / results['files']
+        base_per_file = base_seconds / baseline['files']
+        if per_file > base_per_file * (1 + tolerance):
+            regressions.append(f"{rule}: {per_file * 1e6:.1f} us/file vs baseline {base_per_file * 1e6:.1f} us/file")
+
+    return regressions
+
+
+def print_results(results):
+    print(f"Files: {results['files']}  Lines: {results['lines']}  Findings: {results['findings']}")
+    print(f"Scan: {results['scan_seconds']:.2f}s  {results['files_per_second']:.1f} files/s  {results['lines_per_second']:.0f} lines/s")
+    if results['peak_rss_kb'] is not None:
+        print(f"Peak RSS: {results['peak_rss_kb'] / 1024:.1f} MiB")
+    if results.get('startup_ms') is not None:
+        print(startup_line(results['startup_ms'], results.get('interpreter_ms', 0.0), STARTUP_TARGET_MS))
+    print("\nPer-rule time:")
+    for rule, seconds in sorted(results['rule_seconds'].items(), key=lambda item: item[1], reverse=True):
+        print(f"  {rule:40} {seconds:8.3f}s")
+
+
+def startup_line(startup_ms, interpreter_ms, target_ms):
+    return (f"Startup on one small file: {startup_ms:.1f} ms, {startup_ms - interpreter_ms:.1f} ms more than "
+            f"a bare interpreter (target {target_ms:g} ms more)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the code smell detector on synthetic corpora.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="write a synthetic corpus")
+    generate.add_argument('directory')
+    generate.add_argument('--files', default='1k', help="number of files, or one of " + ", ".join(CORPUS_SIZES))
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--classes', type=int, default=3, help="classes per file")
+    generate.add_argument('--methods', type=int, default=8, help="methods per class")
+    generate.add_argument('--depth', type=int, default=3, help="nesting depth of loops and ifs")
+    generate.add_argument('--duplication', type=float, default=0.1, help="share of functions copied between files")
+
+    run = commands.add_parser('run', help="benchmark a corpus and optionally check it against a baseline")
+    run.add_argument('directory')
+    run.add_argument('-j', '--jobs', type=int, default=1)
+    run.add_argument('-o', '--output', help="write the results as JSON")
+    run.add_argument('--baseline', help="JSON results to compare against")
+    run.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+
+    startup = commands.add_parser('startup', help="time the command line on one small file against the startup target")
+    startup.add_argument('--runs', type=int, default=20)
+    startup.add_argument('--target', type=float, default=STARTUP_TARGET_MS, help="milliseconds on top of a bare interpreter (default: %(default)s)")
+
+    compare = commands.add_parser('compare', help="compare two saved results")
+    compare.add_argument('results')
+    compare.add_argument('baseline')
+    compare.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        files = CORPUS_SIZES.get(args.files) or int(args.files)
+        CorpusGenerator(args.seed, args.classes, args.methods, args.depth, args.duplication).generate(args.directory, files)
+        print(f"Wrote {files} files to {args.directory}")
+        return 0
+
+    if args.command == 'startup':
+        startup_ms, interpreter_ms = benchmark_startup(args.runs)
+        print(startup_line(startup_ms, interpreter_ms, args.target))
+        return 0 if startup_ms - interpreter_ms <= args.target else 1
+
+    if args.command == 'run':
+        results = run_benchmark(args.directory, args.jobs)
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2)
+        baseline_path = args.baseline
+    else:
+        with open(args.results, encoding='utf-8') as file:
+            results = json.load(file)
+        baseline_path = args.baseline
+
+    if not baseline_path:
+        return 0
+
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    regressions = compare_results(results, baseline, args.tolerance)
+    if regressions:
+        print("\nPerformance regressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    print("\nNo performance regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
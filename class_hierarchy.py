@@ -0,0 +1,250 @@
+import ast
+import os
+from collections import namedtuple
+
+# What one module contributes to the index, with every name still unresolved:
+# imports as (alias, dotted target, relative import level) and classes as
+# (qualified name, line, column, base names, names referenced in the class)
+ModuleSummary = namedtuple('ModuleSummary', 'imports classes')
+
+# Metrics of one class across the whole index
+HierarchyMetrics = namedtuple('HierarchyMetrics', 'path name line column dit noc efferent afferent')
+
+# Names that refer to the instance or class itself, never to another class
+SELF_NAMES = {'self', 'cls'}
+
+
+def dotted_name(node):
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return '.'.join(reversed(parts))
+
+
+def base_name(node):
+    # Generic[T] and similar subscripted bases inherit from the subscripted class
+    if isinstance(node, ast.Subscript):
+        node = node.value
+    return dotted_name(node)
+
+
+def class_references(node):
+    """Distinct dotted names used anywhere in a class, such as Foo or module.Foo."""
+    names = set()
+    todo = [node]
+    while todo:
+        node = todo.pop()
+        node_type = type(node)
+        if node_type is ast.Name:
+            names.add(node.id)
+            continue
+        if node_type is ast.Attribute:
+            name = dotted_name(node)
+            if name is not None:
+                # The whole chain is one name, so its parts are not visited again
+                names.add(name)
+                continue
+        todo.extend(ast.iter_child_nodes(node))
+    return tuple(sorted(name for name in names if name.partition('.')[0] not in SELF_NAMES))
+
+
+def summarize_module(tree):
+    """Collect the module-level imports and the classes of a parsed module."""
+    imports = []
+    classes = []
+
+    def visit_body(body, prefix):
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                qualname = prefix + node.name
+                bases = tuple(name for name in map(base_name, node.bases) if name)
+                references = class_references(node)
+                classes.append((qualname, node.lineno, node.col_offset, bases, references))
+                visit_body(node.body, qualname + '.')
+            elif prefix:
+                continue
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.asname:
+                        imports.append((alias.asname, alias.name, 0))
+                    else:
+                        # "import a.b" binds a, and a.b.C is then resolved through it
+                        head = alias.name.partition('.')[0]
+                        imports.append((head, head, 0))
+            elif isinstance(node, ast.ImportFrom):
+                for alias in node.names:
+                    if alias.name != '*':
+                        target = f"{node.module}.{alias.name}" if node.module else alias.name
+                        imports.append((alias.asname or alias.name, target, node.level))
+            elif isinstance(node, (ast.If, ast.Try, ast.With)):
+                # Imports and classes behind "if TYPE_CHECKING:" or "try: ... except ImportError:"
+                visit_body(node.body, prefix)
+                visit_body(getattr(node, 'orelse', ()), prefix)
+                for handler in getattr(node, 'handlers', ()):
+                    visit_body(handler.body, prefix)
+                visit_body(getattr(node, 'finalbody', ()), prefix)
+
+    visit_body(tree.body, '')
+    return ModuleSummary(tuple(imports), tuple(classes))
+
+
+class ClassHierarchy:
+    """Index of the classes of a whole code base, resolving base and referenced names across modules.
+
+    Only per-module summaries are stored, so modules are added, replaced and removed one at a time
+    and nothing needs the trees of unchanged files. Metrics are derived from the summaries in time
+    and memory linear in the number of classes and references.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.summaries = {}
+        self.packages = {}
+
+    def update(self, path, summary):
+        if summary is None:
+            self.summaries.pop(path, None)
+        else:
+            self.summaries[path] = ModuleSummary(*summary)
+
+    def remove(self, path):
+        self.summaries.pop(path, None)
+
+    def is_package(self, directory):
+        package = self.packages.get(directory)
+        if package is None:
+            package = self.packages[directory] = os.path.isfile(os.path.join(directory, '__init__.py'))
+        return package
+
+    def module_names(self, path):
+        """Names a module can be imported by: through its packages first, then by its path below the root."""
+        directory, file = os.path.split(os.path.abspath(path))
+        stem = os.path.splitext(file)[0]
+        parts = [] if stem == '__init__' else [stem]
+        while self.is_package(directory):
+            directory, package = os.path.split(directory)
+            if not package:
+                break
+            parts.append(package)
+        names = ['.'.join(reversed(parts))]
+
+        # Namespace packages and scripts have no __init__.py chain to go by
+        relative = os.path.relpath(os.path.splitext(os.path.abspath(path))[0], os.path.abspath(self.root))
+        if not relative.startswith(os.pardir):
+            relative = relative.replace(os.sep, '.')
+            if relative.endswith('.__init__') or relative == '__init__':
+                relative = relative[:-len('__init__')].rstrip('.')
+            if relative and relative not in names:
+                names.append(relative)
+        return names
+
+    def metrics(self):
+        """Return the HierarchyMetrics of every class, in index order."""
+        modules = {}
+        classes = []
+        class_ids = {}
+
+        for path, summary in self.summaries.items():
+            names = self.module_names(path)
+            is_package = os.path.basename(path) == '__init__.py'
+            imports = {alias: absolute_name(target, level, names[0], is_package) for alias, target, level in summary.imports}
+            for name in names:
+                modules.setdefault(name, imports)
+            for qualname, line, column, bases, references in summary.classes:
+                for name in names:
+                    class_ids.setdefault(f"{name}.{qualname}", len(classes))
+                classes.append((path, names[0], imports, qualname, line, column, bases, references))
+
+        def lookup(full_name, hops=0):
+            class_id = class_ids.get(full_name)
+            if class_id is not None or hops > 5:
+                return class_id
+            # Follow re-exports, such as a package __init__ importing a class from one of its modules
+            parts = full_name.split('.')
+            for i in range(len(parts) - 1, 0, -1):
+                imports = modules.get('.'.join(parts[:i]))
+                if imports is not None:
+                    target = imports.get(parts[i])
+                    if target is None:
+                        return None
+                    return lookup('.'.join([target] + parts[i + 1:]), hops + 1)
+            return None
+
+        resolved = {}
+
+        def resolve(name, module, imports):
+            key = (module, name)
+            if key not in resolved:
+                class_id = class_ids.get(f"{module}.{name}")
+                if class_id is None:
+                    head, dot, rest = name.partition('.')
+                    if head in imports:
+                        class_id = lookup(imports[head] + dot + rest)
+                if class_id is None and dot:
+                    # Foo.create or module.Foo.VALUE still uses Foo
+                    class_id = resolve(name.rpartition('.')[0], module, imports)
+                resolved[key] = class_id
+            return resolved[key]
+
+        parents = []
+        efferent = []
+        afferent = [0] * len(classes)
+        for class_id, (path, module, imports, qualname, line, column, bases, references) in enumerate(classes):
+            # Bases from outside the index still add one level of depth
+            parents.append([resolve(base, module, imports) for base in bases if base != 'object'])
+            used = {resolve(name, module, imports) for name in references}
+            used.discard(None)
+            used.discard(class_id)
+            foreign = [other for other in used if classes[other][1] != module]
+            efferent.append(len(foreign))
+            for other in foreign:
+                afferent[other] += 1
+
+        children = [0] * len(classes)
+        for class_parents in parents:
+            for parent in set(class_parents):
+                if parent is not None:
+                    children[parent] += 1
+
+        depths = [None] * len(classes)
+        for class_id in range(len(classes)):
+            inheritance_depth(class_id, parents, depths)
+
+        return [
+            HierarchyMetrics(path, qualname, line, column, depths[class_id], children[class_id], efferent[class_id], afferent[class_id])
+            for class_id, (path, module, imports, qualname, line, column, bases, references) in enumerate(classes)
+        ]
+
+
+def absolute_name(target, level, module, is_package):
+    # "from ..a import B" inside package p.q.mod means p.a.B
+    if not level:
+        return target
+    package = module.split('.') if is_package else module.split('.')[:-1]
+    if level > 1:
+        package = package[:-(level - 1)]
+    return '.'.join(package + [target])
+
+
+def inheritance_depth(class_id, parents, depths):
+    """Fill in depths[class_id] and those of its ancestors without recursing; cycles count as depth 0."""
+    stack = [class_id]
+    while stack:
+        current = stack[-1]
+        if depths[current] is not None:
+            stack.pop()
+            continue
+        pending = [parent for parent in parents[current] if parent is not None and depths[parent] is None and parent not in stack]
+        if pending:
+            stack.extend(pending)
+            continue
+        depth = 0
+        for parent in parents[current]:
+            parent_depth = 0 if parent is None else depths[parent] or 0
+            depth = max(depth, parent_depth + 1)
+        depths[current] = depth
+        stack.pop()
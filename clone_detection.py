@@ -0,0 +1,207 @@
+import keyword
+import tokenize
+import zlib
+from array import array
+from collections import deque, namedtuple
+
+# Length of a token window (k-gram) and of the winnowing window over k-gram hashes.
+# Any clone of at least KGRAM + WINNOW - 1 tokens is guaranteed to share a fingerprint.
+KGRAM = 40
+WINNOW = 10
+
+# Rabin-Karp rolling hash modulo a Mersenne prime, so fingerprints fit in a signed 64-bit array
+MODULUS = (1 << 61) - 1
+BASE = 1000003
+
+# Tokens that carry no code of their own
+SKIPPED_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+                  tokenize.ENCODING, tokenize.ENDMARKER}
+
+# Fingerprints of one file: k-gram hashes with the first and last line each one covers, as parallel arrays
+Fingerprints = namedtuple('Fingerprints', 'hashes starts ends')
+
+# One copy of a cloned block, pointing at the first occurrence of that block in the scan
+Clone = namedtuple('Clone', 'path start end original_path original_start original_end group group_size')
+
+
+def empty_fingerprints():
+    return Fingerprints(array('q'), array('i'), array('i'))
+
+
+def normalize_token(token):
+    # Identifiers and literals are abstracted, so renamed copies still match
+    if token.type == tokenize.NAME:
+        return token.string if keyword.iskeyword(token.string) else 'N'
+    if token.type == tokenize.NUMBER:
+        return '0'
+    if token.type == tokenize.STRING:
+        return '""'
+    return token.string
+
+
+def fingerprint_tokens(tokens):
+    """Winnow the rolling hashes of the normalized token windows of a file."""
+    token_hashes = []
+    token_lines = []
+    for token in tokens:
+        if token.type not in SKIPPED_TOKENS:
+            token_hashes.append(zlib.crc32(normalize_token(token).encode('utf-8')))
+            token_lines.append(token.start[0])
+
+    fingerprints = empty_fingerprints()
+    if len(token_hashes) < KGRAM:
+        return fingerprints
+
+    top = pow(BASE, KGRAM - 1, MODULUS)
+    kgram_hashes = []
+    rolling = 0
+    for i, token_hash in enumerate(token_hashes):
+        if i >= KGRAM:
+            rolling = (rolling - token_hashes[i - KGRAM] * top) % MODULUS
+        rolling = (rolling * BASE + token_hash) % MODULUS
+        if i >= KGRAM - 1:
+            kgram_hashes.append(rolling)
+
+    # Keep the rightmost minimum of every window of WINNOW k-grams; the deque holds candidate positions
+    candidates = deque()
+    last_selected = -1
+    for i, kgram_hash in enumerate(kgram_hashes):
+        while candidates and kgram_hashes[candidates[-1]] >= kgram_hash:
+            candidates.pop()
+        candidates.append(i)
+        if candidates[0] <= i - WINNOW:
+            candidates.popleft()
+        if i >= WINNOW - 1 or i == len(kgram_hashes) - 1:
+            selected = candidates[0]
+            if selected != last_selected:
+                fingerprints.hashes.append(kgram_hashes[selected])
+                fingerprints.starts.append(token_lines[selected])
+                fingerprints.ends.append(token_lines[selected + KGRAM - 1])
+                last_selected = selected
+
+    return fingerprints
+
+
+def fingerprints_to_bytes(fingerprints):
+    return fingerprints.hashes.tobytes() + fingerprints.starts.tobytes() + fingerprints.ends.tobytes()
+
+
+def fingerprints_from_bytes(data):
+    fingerprints = empty_fingerprints()
+    # 8 bytes of hash and 4 + 4 bytes of lines per fingerprint
+    size = len(data) // 16
+    fingerprints.hashes.frombytes(data[:8 * size])
+    fingerprints.starts.frombytes(data[8 * size:12 * size])
+    fingerprints.ends.frombytes(data[12 * size:])
+    return fingerprints
+
+
+class CloneIndex:
+    """Fingerprint index of a whole scan, kept in flat integer arrays so large code bases fit in memory."""
+
+    def __init__(self):
+        self.paths = []
+        self.hashes = array('q')
+        self.files = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+
+    def add(self, path, fingerprints):
+        file_id = len(self.paths)
+        self.paths.append(path)
+        self.hashes.extend(fingerprints.hashes)
+        self.files.extend([file_id] * len(fingerprints.hashes))
+        self.starts.extend(fingerprints.starts)
+        self.ends.extend(fingerprints.ends)
+
+    def matching_fingerprints(self):
+        # Pair every repeat of a fingerprint with its first occurrence, as (original, copy) entry indexes
+        hashes = self.hashes
+        order = sorted(range(len(hashes)), key=hashes.__getitem__)
+        pairs = []
+        i = 0
+        while i < len(order):
+            j = i + 1
+            while j < len(order) and hashes[order[j]] == hashes[order[i]]:
+                j += 1
+            # The sort is stable, so order[i] is the first occurrence in scan order
+            pairs.extend((order[i], order[k]) for k in range(i + 1, j))
+            i = j
+        return pairs
+
+    def find_clones(self):
+        """Return the clone pairs of the scan, adjacent matches merged into whole blocks and grouped by original."""
+        files, starts, ends = self.files, self.starts, self.ends
+
+        # (original file, copy file, copy start - original start, original start, original end, copy start, copy end):
+        # matches of one alignment share the offset between copy and original, so they sort next to each other
+        matches = sorted(
+            (files[a], files[b], starts[b] - starts[a], starts[a], ends[a], starts[b], ends[b])
+            for a, b in self.matching_fingerprints()
+            if files[a] != files[b] or ends[a] < starts[b] or ends[b] < starts[a]
+        )
+
+        # Only adjacent or overlapping matches of the same alignment make up one block. Within one file a block
+        # stops where its original would run into its copy: copies in a row repeat the seams between them too
+        blocks = []
+        for match in matches:
+            if blocks:
+                last = blocks[-1]
+                if (match[:3] == last[:3] and match[3] <= last[4] + 1
+                        and (match[0] != match[1] or max(last[4], match[4]) < last[5])):
+                    blocks[-1] = last[:4] + (max(last[4], match[4]), last[5], max(last[6], match[6]))
+                    continue
+            blocks.append(match)
+        # (original file, copy file, original start, original end, copy start, copy end)
+        blocks = [block[:2] + block[3:] for block in blocks]
+
+        # A repeat that starts and ends within code reported anyway, such as the seam between two copies in a row, is
+        # left out. Longer blocks are kept first, so a seam never hides the copies it runs between
+        regions = {}
+        kept = []
+        for block in sorted(blocks, key=lambda block: block[3] - block[2], reverse=True):
+            if covered(regions, block[0], block[2:4]) and covered(regions, block[1], block[4:]):
+                continue
+            regions.setdefault(block[0], []).append(block[2:4])
+            regions.setdefault(block[1], []).append(block[4:])
+            kept.append(block)
+        blocks = kept
+
+        # Copies whose originals overlap form one clone group
+        blocks.sort(key=lambda block: (block[0], block[2], block[1], block[4]))
+        groups = []
+        group_end = None
+        for block in blocks:
+            if groups and block[0] == groups[-1][0][0] and block[2] <= group_end:
+                groups[-1].append(block)
+                group_end = max(group_end, block[3])
+            else:
+                groups.append([block])
+                group_end = block[3]
+
+        # Within a group, overlapping stretches of one copy are that copy once, as long as that keeps a copy clear of its original
+        for index, group in enumerate(groups):
+            group.sort(key=lambda block: (block[1], block[4]))
+            merged = []
+            for block in group:
+                last = merged[-1] if merged else None
+                if (last is not None and block[1] == last[1] and block[4] <= last[5]
+                        and (block[0] != block[1] or max(last[3], block[3]) < last[4])):
+                    merged[-1] = (last[0], last[1], min(last[2], block[2]), max(last[3], block[3]), last[4], max(last[5], block[5]))
+                else:
+                    merged.append(block)
+            groups[index] = merged
+
+        clones = []
+        for group_id, group in enumerate(groups, start=1):
+            for original_file, copy_file, original_start, original_end, copy_start, copy_end in group:
+                clones.append(Clone(self.paths[copy_file], copy_start, copy_end, self.paths[original_file],
+                                    original_start, original_end, group_id, len(group) + 1))
+
+        return clones
+
+
+def covered(regions, file_id, lines):
+    # Whether both ends of the lines of a file fall within the originals or copies of blocks already kept;
+    # the lines between two copies that follow each other, such as the blank ones, belong to neither
+    return all(any(start <= line <= end for start, end in regions.get(file_id, ())) for line in lines)
@@ -1,386 +1,1470 @@
 import ast
+import io
 import os
-import radon.complexity as radon_complexity
-from radon.visitors import ComplexityVisitor
-
-# A counter for code smells
-code_smell_count = 0
-
-class CodeSmellDetector:
-    def __init__(self, directory):
-        self.directory = directory
+import sys
+import tokenize
+from bisect import bisect_right
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from functools import cached_property, lru_cache
+from operator import itemgetter
+from time import perf_counter
+from class_hierarchy import ClassHierarchy, summarize_module
+from clone_detection import CloneIndex, empty_fingerprints, fingerprint_tokens, fingerprints_from_bytes, fingerprints_to_bytes
+from file_discovery import FileFinder, load_config
+from profiling import NULL_TIMER, Profiler, PrometheusTextfileExporter, RuleTimer, cprofile_to
+from rules import ALL_RULES, RULES, RuleSet, load_profile
+
+# Bump whenever a rule or threshold changes, so cached findings from older versions are not reused
+DETECTOR_VERSION = '7'
+
+# How each rule id is reported as text; metric values of a finding can be used as fields
+MESSAGES = {
+    'TOO_MANY_ARGUMENTS': "Too many arguments: {symbol} in {path}",
+    'LONG_METHOD': "Long method: {symbol} in {path}",
+    'NESTED_LOOPS': "Too many nested loops: {symbol} in {path}",
+    'LARGE_CLASS': "Large class: {symbol} in {path} (LOC: {loc}, NOA+NOM: {noa_nom})",
+    'LONG_BASE_LIST': "Long base class list: {symbol} in {path}",
+    'HIGH_COMPLEXITY': "High complexity: {symbol} in {path} with complexity {complexity}",
+    'COMPLEXITY_ERROR': "Error analyzing complexity for {path}: {error}",
+    'DUPLICATE_CODE': "Duplicated code detected: Block starting at line {line} in {path} duplicates {original_path} at line {original_line}",
+    'MAGIC_NUMBER': "Potential magic number {symbol} detected at line {line}",
+    'DEEP_INHERITANCE': "Deep inheritance chain in class {symbol} in {path} (depth {dit})",
+    'HIGH_COUPLING': "High coupling: class {symbol} in {path} uses {efferent} classes of other modules",
+    'EXCESSIVE_COMMENTS': "Excessive comments in {path} ({comments} comments)",
+    'TOO_MANY_IMPORTS': "Unnecessary number of imports in {path}",
+    'LONG_LINE': "Long line detected in {path} at line {line}",
+    'UNREACHABLE_CODE': "Unreachable code after return in function {symbol} in {path}",
+    'FUNCTION_NAME': "Non-PEP8 compliant function name: {symbol} in {path}",
+    'VARIABLE_NAME': "Non-PEP8 compliant variable name: {symbol} in {path}",
+    'USELESS_EXCEPTION': "Useless exception handling in {path}",
+    'COMPLEX_LIST_COMPREHENSION': "Complex list comprehension in {path} at line {line}",
+    'FUNCTIONAL_DECOMPOSITION': "Functional decomposition detected in method {symbol} in {path}",
+    'SPAGHETTI_CODE': "Spaghetti code detected in class {symbol} in {path}",
+    'FEATURE_ENVY': "Feature Envy detected in method {symbol} in {path}",
+    'GOD_CLASS': "God Class detected: {symbol} in {path}",
+    'ANALYSIS_ERROR': "Error analyzing file {path}: {error}",
+    'AST_SKIPPED': "Only lexical rules were run on {path}: over the {reason} limit of {limit}",
+    'FILE_SKIPPED': "Skipped {path}: {size} bytes is over the file size limit of {limit}",
+}
+
+# Groups of AST rules in the order analyze_file reports them; the node types they consume are declared in rules.RULES
+TREE_RULES = (
+    'functions', 'classes', 'unreachable_code', 'naming_conventions', 'useless_exception_handling',
+    'list_comprehension_complexity', 'functional_decomposition', 'spaghetti_code', 'feature_envy', 'god_class',
+)
+
+# Groups of lexical rules, which share the single tokenize pass
+LEXICAL_RULES = ('magic_numbers', 'excessive_comments', 'unnecessary_imports', 'long_lines')
+
+# Numbers that are never reported as magic
+MAGIC_NUMBER_ALLOWLIST = (0, 1, -1)
+
+# Token types that end or open a logical line without being part of a statement
+STATEMENT_BREAKS = {tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT}
+LAYOUT_TOKENS = {tokenize.NL, tokenize.COMMENT, tokenize.ENCODING, tokenize.ENDMARKER}
+
+# Rules reported on a whole function or class, at its def or class line and column
+NODE_RULES = {
+    'TOO_MANY_ARGUMENTS', 'LONG_METHOD', 'NESTED_LOOPS', 'LARGE_CLASS', 'LONG_BASE_LIST', 'HIGH_COMPLEXITY',
+    'FUNCTION_NAME', 'FUNCTIONAL_DECOMPOSITION', 'SPAGHETTI_CODE', 'FEATURE_ENVY', 'GOD_CLASS',
+}
+
+# Top-level statements that are analyzed, and cached, one at a time when a unit cache is used
+UNIT_TYPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+# Rules that need the per-function attribute metrics (ATFD, LAA, ...) gathered during the walk
+METRIC_RULES = {'feature_envy', 'god_class'}
+
+# Budgets of the in-memory analysis of one file. Larger files only get the lexical rules, which
+# stream over the file instead of holding it, its tokens and its tree in memory
+DEFAULT_AST_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_AST_MEMORY_MB = 1024
+DEFAULT_AST_TIMEOUT = 60
+
+# Memory the text, tokens and tree of a file take per byte of source, measured on large stdlib modules
+AST_BYTES_PER_SOURCE_BYTE = 100
+
+
+class Finding(namedtuple('Finding', 'rule path line column symbol metrics')):
+    """One detected smell: the rule id, where it was found, the function/class/name it is about
+    and the metric values behind it as (name, value) pairs. Line 0 means the whole file."""
+    __slots__ = ()
+
+    def __str__(self):
+        return MESSAGES[self.rule].format(path=self.path, line=self.line, symbol=self.symbol, **dict(self.metrics))
+
+    def to_json(self):
+        return {
+            'rule': self.rule,
+            'path': self.path,
+            'line': self.line,
+            'column': self.column,
+            'symbol': self.symbol,
+            'metrics': dict(self.metrics),
+            'message': str(self),
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        # Rebuild a finding from its JSON form, where tuples came back as lists
+        rule, path, line, column, symbol, metrics = row
+        return cls(rule, path, line, column, symbol, tuple(tuple(metric) for metric in metrics))
+
+
+# What analyzing one file produces: its findings, the fingerprints the clone index needs and the
+# ModuleSummary the class hierarchy needs. timer holds the RuleTimer of the file when profiling, and
+# metrics its metrics_report.FileMetrics when they are collected; both are None otherwise. units holds the
+# (key, UnitResult) pairs a pool worker added to its unit cache for the file, for the scan to keep
+FileResult = namedtuple('FileResult', 'findings fingerprints classes timer metrics units', defaults=(None, None, None, None))
+
+
+class AnalysisTimeout(BaseException):
+    """Raised into the analysis of a file that is out of time. It is not an Exception, so the
+    `except Exception` handlers of single rules cannot swallow it."""
+
+
+@contextmanager
+def deadline(seconds):
+    """Raise AnalysisTimeout inside the block once seconds have passed.
+
+    This needs SIGALRM, so it only applies in the main thread on POSIX; elsewhere, such as in the
+    GUI's scan thread, the block runs without a limit. C code like ast.parse is interrupted only
+    when it returns.
+    """
+    import signal
+
+    def expire(signum, frame):
+        raise AnalysisTimeout()
+
+    previous = installed = None
+    if seconds and hasattr(signal, 'setitimer'):
+        try:
+            previous = signal.signal(signal.SIGALRM, expire)
+            installed = True
+        except ValueError:  # not the main thread
+            pass
+    if not installed:
+        yield
+        return
+
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def clone_finding(clone):
+    return Finding('DUPLICATE_CODE', clone.path, clone.start, 0, '', (
+        ('end_line', clone.end), ('original_path', clone.original_path), ('original_line', clone.original_start),
+        ('original_end_line', clone.original_end), ('group', clone.group), ('group_size', clone.group_size)))
+
+
+def skipped_findings(file_finder):
+    # Files left out for their size; generated files are left out by design and not reported
+    return [Finding('FILE_SKIPPED', path, 0, 0, '', (('size', size), ('limit', file_finder.max_file_size)))
+            for path, size in file_finder.oversized]
+
+
+def config_budgets(config, ast_max_bytes=None, ast_memory_mb=None, ast_timeout=None):
+    """The AST budgets of a [tool.code-smells] table, as detector keyword arguments; arguments that are not None take precedence."""
+    budgets = {
+        'ast_max_bytes': ast_max_bytes if ast_max_bytes is not None else config.get('ast-max-size', DEFAULT_AST_MAX_BYTES),
+        'ast_memory_mb': ast_memory_mb if ast_memory_mb is not None else config.get('ast-memory-mb', DEFAULT_AST_MEMORY_MB),
+        'ast_timeout': ast_timeout if ast_timeout is not None else config.get('ast-timeout', DEFAULT_AST_TIMEOUT),
+    }
+    # 0 turns a budget off
+    return {name: value or None for name, value in budgets.items()}
+
+
+def config_allowed_numbers(config):
+    """The numbers a [tool.code-smells] table lets appear without a name; raises ValueError if they are not numbers."""
+    numbers = config.get('allowed-numbers', MAGIC_NUMBER_ALLOWLIST)
+    if not isinstance(numbers, (list, tuple)) or any(isinstance(number, bool) or not isinstance(number, (int, float))
+                                                     for number in numbers):
+        raise ValueError(f"allowed-numbers must be a list of numbers, not {numbers!r}")
+    return tuple(numbers)
+
+
+# The detectors of a pool worker process, set once by init_pool_worker when the worker starts
+pool_detectors = ()
+
+
+def init_pool_worker(*detectors):
+    global pool_detectors
+    pool_detectors = detectors
+    # Each worker reads the unit cache once and never saves it; what it adds goes back with the results
+    for detector in detectors:
+        unit_cache = detector.units()
+        if unit_cache is not None:
+            unit_cache.added = []
+
+
+def analyze_task(task):
+    index, detector_index, file_path = task
+    detector = pool_detectors[detector_index]
+    result = detector.analyze(file_path)
+    if detector.unit_cache is not None and detector.unit_cache.added:
+        result = result._replace(units=detector.unit_cache.added)
+        detector.unit_cache.added = []
+    return index, result
+
+
+def iter_analyzed(detectors, tasks, jobs):
+    """Analyze (detector index, path) tasks and yield their results in task order, on a process pool if jobs > 1."""
+    if jobs > 1 and len(tasks) > 1:
+        yield from iter_in_parallel(detectors, tasks, jobs)
+    else:
+        for detector_index, file_path in tasks:
+            yield detectors[detector_index].analyze(file_path)
+
+
+def iter_in_parallel(detectors, tasks, jobs):
+    detector_indexes = [detector_index for detector_index, file_path in tasks]
+    # Largest files go first so a huge module starts early instead of finishing last
+    tasks = sorted(((index, detector_index, file_path) for index, (detector_index, file_path) in enumerate(tasks)),
+                   key=lambda task: file_size(task[2]), reverse=True)
+    finished = {}
+    next_index = 0
+
+    # The detectors go to each worker once; tasks only name one of them by its index.
+    # chunksize=1 keeps every file on the shared task queue, so idle workers pick up the next one
+    import multiprocessing
+    with multiprocessing.Pool(min(jobs, len(tasks)), initializer=init_pool_worker, initargs=tuple(detectors)) as pool:
+        for index, result in pool.imap_unordered(analyze_task, tasks, chunksize=1):
+            if result.units:
+                detectors[detector_indexes[index]].add_units(result.units)
+                result = result._replace(units=None)
+            finished[index] = result
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
+
+
+def iter_cached(cache, keys, hits, analyzed):
+    """Yield the result of every file, loaded from the cache for hits and else taken from analyzed and stored."""
+    for key, hit in zip(keys, hits):
+        if hit:
+            rows, fingerprints, classes, metrics = cache.load(key)
+            if metrics is not None:
+                from metrics_report import FileMetrics
+                metrics = FileMetrics.from_row(metrics)
+            yield FileResult([Finding.from_row(row) for row in rows], fingerprints_from_bytes(fingerprints), classes,
+                             metrics=metrics)
+        else:
+            result = next(analyzed)
+            if key is not None:
+                cache.put(key, result.findings, fingerprints_to_bytes(result.fingerprints), result.classes, result.metrics)
+            yield result
+
+
+def error_finding(file_path, error):
+    line = getattr(error, 'lineno', None) if isinstance(error, SyntaxError) else None
+    return Finding('ANALYSIS_ERROR', file_path, line or 0, 0, '', (('error', str(error)), ('error_type', type(error).__name__)))
+
+
+def hierarchy_findings(hierarchy, thresholds=ALL_RULES.thresholds):
+    deep = thresholds.get('DEEP_INHERITANCE')
+    coupling = thresholds.get('HIGH_COUPLING')
+    if deep is None and coupling is None:
+        return []
+
+    findings = []
+    for metrics in hierarchy.metrics():
+        # Depth of inheritance tree (DIT) threshold = 5
+        if deep is not None and metrics.dit > deep['dit']:
+            findings.append(Finding('DEEP_INHERITANCE', metrics.path, metrics.line, metrics.column, metrics.name,
+                                    (('dit', metrics.dit), ('noc', metrics.noc))))
+        # Coupling between objects (CBO) threshold = 14, counting classes of other modules only
+        if coupling is not None and metrics.efferent > coupling['efferent']:
+            findings.append(Finding('HIGH_COUPLING', metrics.path, metrics.line, metrics.column, metrics.name,
+                                    (('efferent', metrics.efferent), ('afferent', metrics.afferent))))
+    return findings
+
+
+class FunctionMetrics:
+    """Attribute access metrics of one function, including everything nested inside it."""
+    __slots__ = ('node', 'foreign_accesses', 'local_accesses', 'foreign_classes', 'self_attrs', 'attrs')
+
+    def __init__(self, node):
+        self.node = node
+        self.foreign_accesses = 0
+        self.local_accesses = 0
+        self.foreign_classes = set()
+        self.self_attrs = set()
+        self.attrs = set()
+
+    def add_attribute(self, node):
+        self.attrs.add(node.attr)
+        if isinstance(node.value, ast.Name):
+            if node.value.id != 'self':
+                self.foreign_accesses += 1
+                self.foreign_classes.add(node.value.id)
+            else:
+                self.local_accesses += 1
+                self.self_attrs.add(node.attr)
+
+    @property
+    def atfd(self):
+        return self.foreign_accesses
+
+    @property
+    def fdp(self):
+        return len(self.foreign_classes)
+
+    @property
+    def laa(self):
+        total = self.local_accesses + self.foreign_accesses
+        return self.local_accesses / total if total > 0 else 0
+
+
+class ClassMetrics:
+    """Size metrics of one class, computed from its direct body."""
+    __slots__ = ('node', 'methods', 'noa', 'nom', 'loc', 'wmc', 'private_fields')
+
+    def __init__(self, node):
+        self.node = node
+        self.methods = [n for n in node.body if isinstance(n, ast.FunctionDef)]
+        self.noa = sum(1 for n in node.body if isinstance(n, ast.Assign))
+        self.nom = len(self.methods)
+        self.loc = self.noa + self.nom
+        self.wmc = sum(len(method.body) for method in self.methods)
+        self.private_fields = sum(1 for n in node.body if isinstance(n, ast.Assign) and any(t.id.startswith('_') for t in n.targets if isinstance(t, ast.Name)))
+
+
+@lru_cache(maxsize=None)
+def compile_dispatch(visitor_class, rule_set, groups):
+    """Dispatch table of a visitor: node or token type -> visit functions of the enabled groups, in report order.
+
+    It only depends on the rule set, so it is built once per scan rather than once per file.
+    """
+    dispatch = {}
+    for group in groups:
+        for node_type in rule_set.consumes(group):
+            dispatch.setdefault(node_type, []).append(getattr(visitor_class, 'visit_' + group))
+    return {node_type: tuple(functions) for node_type, functions in dispatch.items()}
+
+
+def timed_dispatch(dispatch, timer, prefix):
+    # Only used when profiling, so disabled scans keep calling the bare functions
+    return {
+        node_type: tuple(timer.wrap(prefix + function.__name__[len('visit_'):], function) for function in functions)
+        for node_type, functions in dispatch.items()
+    }
+
+
+class SmellVisitor:
+    """Walks a tree once and sends each node only to the rules registered for its type."""
+
+    def __init__(self, file_path, rules=None, timer=None, rule_set=ALL_RULES, collect_metrics=False, track_depth=False):
+        self.file_path = file_path
+        self.timer = timer
+        self.rules = [rule for rule in TREE_RULES if rule_set.uses(rule) and (rules is None or rule in rules)]
+        self.thresholds = rule_set.thresholds
+        self.findings = {rule: [] for rule in self.rules}
+        # collect_metrics gathers the metrics of every function and class, even with no rule that needs them
+        self.collect_metrics = collect_metrics or any(rule in METRIC_RULES for rule in self.rules)
+        self.function_metrics = {}
+        self.class_metrics = {}
+        self.functions = []
+        self.classes = []
+        # With track_depth, the depth of every function and class and of the node each finding was reported from,
+        # so the findings of separately walked units can be merged back into the order of one walk
+        self.node_depths = {} if track_depth else None
+        self.finding_depths = {rule: [] for rule in self.rules}
+        self.depth = 0
+
+        self.dispatch = compile_dispatch(SmellVisitor, rule_set, tuple(self.rules))
+        if timer is not None:
+            self.dispatch = timed_dispatch(self.dispatch, timer, 'tree:')
+
+    def run(self, tree):
+        dispatch = self.dispatch
+        collect_metrics = self.collect_metrics
+        node_depths = self.node_depths
+        todo = deque([(tree, (), 0)])
+
+        # Same breadth-first order as ast.walk, so findings come out in the order the old per-rule walks gave
+        while todo:
+            node, scope, depth = todo.popleft()
+            node_type = type(node)
+            if node_depths is not None:
+                self.depth = depth
+                if node_type in UNIT_TYPES:
+                    node_depths[node] = depth
+            if collect_metrics:
+                if node_type is ast.FunctionDef:
+                    frame = FunctionMetrics(node)
+                    self.function_metrics[node] = frame
+                    scope = scope + (frame,)
+                elif node_type is ast.Attribute:
+                    for frame in scope:
+                        frame.add_attribute(node)
+                elif node_type is ast.ClassDef:
+                    self.get_class_metrics(node)
+            todo.extend((child, scope, depth + 1) for child in ast.iter_child_nodes(node))
+
+            handlers = dispatch.get(node_type)
+            if handlers:
+                for handler in handlers:
+                    handler(self, node)
+
+        timer = self.timer or NULL_TIMER
+        if 'feature_envy' in self.findings:
+            with timer.measure('tree:feature_envy'):
+                self.finish_feature_envy()
+        if 'god_class' in self.findings:
+            with timer.measure('tree:god_class'):
+                self.finish_god_class()
+
+        return self.findings
+
+    def report(self, group, rule, node, symbol='', **metrics):
+        self.findings[group].append(Finding(rule, self.file_path, node.lineno, node.col_offset, symbol, tuple(metrics.items())))
+        if self.node_depths is not None:
+            # Rules judged after the walk report functions and classes, whose depth was kept
+            self.finding_depths[group].append(self.node_depths.get(node, self.depth))
+
+    def get_class_metrics(self, node):
+        metrics = self.class_metrics.get(node)
+        if metrics is None:
+            metrics = self.class_metrics[node] = ClassMetrics(node)
+        return metrics
+
+    def visit_functions(self, node):
+        thresholds = self.thresholds
+
+        # Research paper metric: "Many Parameters" threshold = 5
+        limits = thresholds.get('TOO_MANY_ARGUMENTS')
+        if limits is not None and len(node.args.args) > limits['args']:
+            self.report('functions', 'TOO_MANY_ARGUMENTS', node, node.name, args=len(node.args.args))
+
+        # Research paper metric: "Long Method" threshold = 100 lines
+        limits = thresholds.get('LONG_METHOD')
+        if limits is not None and len(node.body) > limits['statements']:
+            self.report('functions', 'LONG_METHOD', node, node.name, statements=len(node.body))
+
+        # Nested loops threshold = 3 (general threshold)
+        limits = thresholds.get('NESTED_LOOPS')
+        if limits is not None:
+            nested_loops = sum(1 for n in node.body if isinstance(n, (ast.For, ast.While)))
+            if nested_loops > limits['loops']:
+                self.report('functions', 'NESTED_LOOPS', node, node.name, loops=nested_loops)
+
+    def visit_classes(self, node):
+        thresholds = self.thresholds
+        metrics = self.get_class_metrics(node)
+
+        # Research paper metric: "Large Class" threshold = 200 lines or NOA+NOM > 40
+        limits = thresholds.get('LARGE_CLASS')
+        if limits is not None and (metrics.loc > limits['loc'] or (metrics.noa + metrics.nom) > limits['noa_nom']):
+            self.report('classes', 'LARGE_CLASS', node, node.name, loc=metrics.loc, noa_nom=metrics.noa + metrics.nom)
+
+        # Research paper metric: "Long Base Class List" threshold = 3
+        limits = thresholds.get('LONG_BASE_LIST')
+        if limits is not None and len(node.bases) > limits['bases']:
+            self.report('classes', 'LONG_BASE_LIST', node, node.name, bases=len(node.bases))
+
+    # Did not need research paper for this one
+    def visit_unreachable_code(self, node):
+        has_return = False
+        for stmt in node.body:
+            if isinstance(stmt, ast.Return):
+                has_return = True
+            elif has_return:
+                self.report('unreachable_code', 'UNREACHABLE_CODE', stmt, node.name)
+                break
+
+    def visit_naming_conventions(self, node):
+        # Check for PEP8 non-compliance in variable/function names; the dispatch table only sends the
+        # node types of the enabled naming rules
+        if isinstance(node, ast.FunctionDef):
+            if not node.name.islower() or '_' not in node.name:
+                self.report('naming_conventions', 'FUNCTION_NAME', node, node.name)
+        elif not node.id.islower() or '_' not in node.id:
+            self.report('naming_conventions', 'VARIABLE_NAME', node, node.id)
+
+    def visit_useless_exception_handling(self, node):
+        # Research paper metric: "Useless Exception Handling" NEC = 1 and NGEC = 1 or NEEC = NEEC
+        except_count = len(node.handlers)
+        general_except_count = sum(1 for handler in node.handlers if handler.type is None)
+        if except_count == 1 and general_except_count == 1:
+            self.report('useless_exception_handling', 'USELESS_EXCEPTION', node)
 
-    def scan_for_smells(self):
-        global code_smell_count
-        code_smell_count = 0
-        smells = []
+    def visit_list_comprehension_complexity(self, node):
+        # Research paper metric: "Complex List Comprehension" NOL + NOCC >= 4
+        num_loops = sum(1 for gen in node.generators if isinstance(gen, ast.comprehension))
+        num_conditions = sum(1 for gen in node.generators if gen.ifs)
+        if num_loops + num_conditions >= self.thresholds['COMPLEX_LIST_COMPREHENSION']['loops_and_conditions']:
+            self.report('list_comprehension_complexity', 'COMPLEX_LIST_COMPREHENSION', node, loops=num_loops, conditions=num_conditions)
 
-        # Walk through the directory and find any Python files
-        for root, dirs, files in os.walk(self.directory):
-            for file in files:
-                if file.endswith('.py'):
-                    file_path = os.path.join(root, file)
-                    smells.extend(self.analyze_file(file_path))
+    def visit_functional_decomposition(self, node):
+        # Research paper metric: Functional Decomposition LOCMETHOD >= 151
+        if len(node.body) >= self.thresholds['FUNCTIONAL_DECOMPOSITION']['statements']:
+            self.report('functional_decomposition', 'FUNCTIONAL_DECOMPOSITION', node, node.name, statements=len(node.body))
 
-        return smells
+    def visit_spaghetti_code(self, node):
+        # Research paper metric: Spaghetti Code NPRIVFIELD >= 7 and NMD = 16
+        limits = self.thresholds['SPAGHETTI_CODE']
+        metrics = self.get_class_metrics(node)
+        if metrics.private_fields >= limits['private_fields'] and metrics.nom == limits['methods']:
+            self.report('spaghetti_code', 'SPAGHETTI_CODE', node, node.name, private_fields=metrics.private_fields, methods=metrics.nom)
 
-    def analyze_file(self, file_path):
-        global code_smell_count
-        smells = []
+    def visit_feature_envy(self, node):
+        # Attribute accesses below this function are still to come, so it is judged in finish_feature_envy
+        self.functions.append(node)
 
-        try:
-            # Open the file in read mode with UTF-8 encoding, ignoring errors
-            with open(file_path, 'r', errors='ignore', encoding='utf-8') as file:
-                content = file.read()
-                tree = ast.parse(content)
-
-                smells.extend(self.check_functions(tree, file_path))
-                smells.extend(self.check_classes(tree, file_path))
-                smells.extend(self.check_complexity(file_path))
-                smells.extend(self.check_for_duplicates(content))
-                smells.extend(self.check_for_magic_numbers(content))
-                smells.extend(self.check_for_deep_inheritance(tree))
-                smells.extend(self.check_excessive_comments(content, file_path))
-                smells.extend(self.check_unnecessary_imports(content, file_path))
-                smells.extend(self.check_long_lines(content, file_path))
-                smells.extend(self.check_unreachable_code(tree, file_path))
-                smells.extend(self.check_naming_conventions(tree, file_path))  # Added
-                smells.extend(self.check_useless_exception_handling(tree, file_path))  # Added
-                smells.extend(self.check_list_comprehension_complexity(tree, file_path))  # Added
-                smells.extend(self.check_functional_decomposition(tree, file_path))  # Added
-                smells.extend(self.check_spaghetti_code(tree, file_path))  # Added
-                smells.extend(self.check_feature_envy(tree, file_path))  # Added
-                smells.extend(self.check_god_class(tree, file_path))  # Added
+    def visit_god_class(self, node):
+        self.classes.append(node)
 
-        except Exception as e:
-            smells.append(f"Error analyzing file {file_path}: {str(e)}")
-            code_smell_count += 1
+    def finish_feature_envy(self):
+        # Research paper metric: Feature Envy FDP <= 5 and ATFD > 5 and LAA < 1/3
+        limits = self.thresholds['FEATURE_ENVY']
+        for node in self.functions:
+            metrics = self.function_metrics[node]
+            if metrics.fdp <= limits['fdp'] and metrics.atfd > limits['atfd'] and metrics.laa < limits['laa']:
+                self.report('feature_envy', 'FEATURE_ENVY', node, node.name, fdp=metrics.fdp, atfd=metrics.atfd, laa=metrics.laa)
 
-        return smells
+    def finish_god_class(self):
+        # Research paper metric: God Class WMC >= 47, ATFD > 5, TCC < 1/3
+        limits = self.thresholds['GOD_CLASS']
+        for node in self.classes:
+            metrics = self.get_class_metrics(node)
+            atfd, tcc = self.class_coupling(metrics)
+            if metrics.wmc >= limits['wmc'] and atfd > limits['atfd'] and tcc < limits['tcc']:
+                self.report('god_class', 'GOD_CLASS', node, node.name, wmc=metrics.wmc, atfd=atfd, tcc=tcc)
+
+    def class_coupling(self, metrics):
+        """(ATFD, TCC) of a class from the attribute metrics of its methods."""
+        methods = [self.function_metrics[method] for method in metrics.methods]
+        atfd = sum(method.atfd for method in methods)
+        shared_attributes = set()
+        for method in methods:
+            shared_attributes |= method.self_attrs
+        connected_methods = sum(1 for method in methods if not method.attrs.isdisjoint(shared_attributes))
+        tcc = connected_methods / metrics.nom if metrics.nom > 0 else 0
+        return atfd, tcc
+
+
+class LexicalVisitor:
+    """Runs the lexical rules over one tokenize pass of a file, dispatching each token by type."""
+
+    def __init__(self, file_path, allowed_numbers=MAGIC_NUMBER_ALLOWLIST, rules=None, timer=None, rule_set=ALL_RULES):
+        self.file_path = file_path
+        self.timer = timer
+        self.allowed_numbers = set(allowed_numbers)
+        self.rules = [rule for rule in LEXICAL_RULES if rule_set.uses(rule) and (rules is None or rule in rules)]
+        self.thresholds = rule_set.thresholds
+        self.findings = {rule: [] for rule in self.rules}
+        # Lines of the comments and module-level imports the file-wide rules count
+        self.comment_lines = []
+        self.import_lines = []
+
+        self.dispatch = compile_dispatch(LexicalVisitor, rule_set, tuple(self.rules))
+        if timer is not None:
+            self.dispatch = timed_dispatch(self.dispatch, timer, 'lexical:')
+
+    @property
+    def needs_tokens(self):
+        return bool(self.dispatch)
+
+    def run(self, context):
+        dispatch = self.dispatch
+        # The first two tokens of the current logical line and the token before this one
+        statement = []
+        previous = None
+
+        # Files are only tokenized for rules that consume tokens
+        for token in context.tokens if dispatch else ():
+            token_type = token.type
+            if token_type in STATEMENT_BREAKS:
+                statement = []
+                continue
+
+            handlers = dispatch.get(token_type)
+            if handlers:
+                for handler in handlers:
+                    handler(self, token, statement, previous)
+
+            if token_type not in LAYOUT_TOKENS:
+                if len(statement) < 2:
+                    statement.append(token)
+                previous = token
+
+        timer = self.timer or NULL_TIMER
+        if 'excessive_comments' in self.findings:
+            self.finish_excessive_comments()
+        if 'unnecessary_imports' in self.findings:
+            self.finish_unnecessary_imports()
+        if 'long_lines' in self.findings:
+            with timer.measure('lexical:long_lines'):
+                self.check_long_lines(context.lines)
+
+        return self.findings
+
+    def metric_lines(self):
+        # The lines that add to the count behind each file-wide finding
+        return {'EXCESSIVE_COMMENTS': self.comment_lines, 'TOO_MANY_IMPORTS': self.import_lines}
+
+    def visit_magic_numbers(self, token, statement, previous):
+        # NAME = 42 at the start of a statement is how a magic number gets its name, not a use of one
+        if len(statement) == 2 and statement[0].string.isupper() and statement[1].string == '=':
+            return
 
-    def check_functions(self, tree, file_path):
-        global code_smell_count
-        issues = []
+        try:
+            value = ast.literal_eval(token.string)
+        except (ValueError, SyntaxError):
+            # Not a number Python accepts, e.g. 0777 from Python 2; the AST rules report the syntax error
+            return
+        if value in self.allowed_numbers:
+            return
+        if previous is not None and previous.string == '-' and -value in self.allowed_numbers:
+            return
+
+        self.findings['magic_numbers'].append(Finding('MAGIC_NUMBER', self.file_path, token.start[0], token.start[1], token.string, ()))
+
+    def visit_excessive_comments(self, token, statement, previous):
+        self.comment_lines.append(token.start[0])
+
+    def visit_unnecessary_imports(self, token, statement, previous):
+        # Module-level import statements only; imports deferred into functions are deliberate
+        if not statement and token.start[1] == 0 and token.string in ('import', 'from'):
+            self.import_lines.append(token.start[0])
+
+    def finish_excessive_comments(self):
+        # Research paper metric: Excessive comments threshold = 20
+        if len(self.comment_lines) > self.thresholds['EXCESSIVE_COMMENTS']['comments']:
+            self.findings['excessive_comments'].append(Finding('EXCESSIVE_COMMENTS', self.file_path, 0, 0, '', (('comments', len(self.comment_lines)),)))
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                # Research paper metric: "Many Parameters" threshold = 5
-                if len(node.args.args) > 5:
-                    issues.append(f"Too many arguments: {node.name} in {file_path}")
-                    code_smell_count += 1
+    # General metric
+    def finish_unnecessary_imports(self):
+        if len(self.import_lines) > self.thresholds['TOO_MANY_IMPORTS']['imports']:
+            self.findings['unnecessary_imports'].append(Finding('TOO_MANY_IMPORTS', self.file_path, 0, 0, '', (('imports', len(self.import_lines)),)))
 
-                # Research paper metric: "Long Method" threshold = 100 lines
-                if len(node.body) > 100:
-                    issues.append(f"Long method: {node.name} in {file_path}")
-                    code_smell_count += 1
+    def check_long_lines(self, lines):
+        # Research paper metric: Long line threshold = 80 characters
+        max_length = self.thresholds['LONG_LINE']['length']
+        for i, line in enumerate(lines, start=1):
+            if len(line) > max_length:
+                self.findings['long_lines'].append(Finding('LONG_LINE', self.file_path, i, 0, '', (('length', len(line)),)))
+
+
+class FileContext:
+    """Everything the checks need about one file, read and parsed once and shared by all of them."""
+
+    def __init__(self, path, data):
+        self.path = path
+        # Same text open(..., errors='ignore', encoding='utf-8') would give, universal newlines included.
+        # The raw bytes are not kept, so only one copy of the file stays in memory besides its lines
+        self.content = data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+        self.lines = self.content.split('\n')
+
+    @cached_property
+    def tree(self):
+        # Parsed on first use, so scans with only lexical rules never build a tree
+        return ast.parse(self.content)
+
+    @cached_property
+    def complexity_blocks(self):
+        # radon's functions, classes and methods, shared by the complexity rule and the metrics.
+        # radon is the slowest import of the detector, so it waits until the first file needs it
+        from radon.visitors import ComplexityVisitor
+        return ComplexityVisitor.from_ast(self.tree).blocks
+
+    @classmethod
+    def from_path(cls, path):
+        with open(path, 'rb') as file:
+            return cls(path, file.read())
+
+    @cached_property
+    def tokens(self):
+        tokens = []
+        try:
+            for token in tokenize.generate_tokens(io.StringIO(self.content).readline):
+                tokens.append(token)
+        except (tokenize.TokenError, SyntaxError):
+            # Keep what was tokenized up to the problem rather than lose the whole file
+            pass
+        return tokens
+
+
+class StreamingContext:
+    """The lexical view of a file too large to analyze in memory.
+
+    Tokens and lines are read from disk a buffered line at a time each time they are iterated, so
+    memory stays bounded by the longest line rather than the size of the file.
+    """
+
+    def __init__(self, path, data=None):
+        self.path = path
+        # Source that is already in memory, such as a buffer sent to the service, is read from there
+        self.data = data
+
+    def open(self):
+        # Decoded the same way as FileContext.content
+        if self.data is not None:
+            return io.TextIOWrapper(io.BytesIO(self.data), encoding='utf-8', errors='ignore')
+        return open(self.path, encoding='utf-8', errors='ignore')
+
+    @property
+    def tokens(self):
+        with self.open() as file:
+            try:
+                yield from tokenize.generate_tokens(file.readline)
+            except (tokenize.TokenError, SyntaxError):
+                pass
+
+    @property
+    def lines(self):
+        with self.open() as file:
+            for line in file:
+                yield line[:-1] if line.endswith('\n') else line
 
-                # Nested loops threshold = 3 (general threshold)
-                nested_loops = sum(1 for n in node.body if isinstance(n, (ast.For, ast.While)))
-                if nested_loops > 3:
-                    issues.append(f"Too many nested loops: {node.name} in {file_path}")
-                    code_smell_count += 1
 
-        return issues
+class CodeSmellDetector:
+    def __init__(self, directory, jobs=1, use_cache=False, cache_dir=None, allowed_numbers=MAGIC_NUMBER_ALLOWLIST, profiler=None,
+                 file_finder=None, cache_max_bytes=None, ast_max_bytes=DEFAULT_AST_MAX_BYTES,
+                 ast_memory_mb=DEFAULT_AST_MEMORY_MB, ast_timeout=DEFAULT_AST_TIMEOUT, rules=ALL_RULES, changed_lines=None,
+                 collect_metrics=False):
+        self.directory = directory
+        # The RuleSet of the scan: which rules run and their thresholds
+        self.rules = rules
+        # Decides which files are scanned; by default from the pyproject.toml of the scanned directory
+        self.file_finder = file_finder or FileFinder.from_config(directory)
+        # Per-rule and per-file timing is only collected when a Profiler is given
+        self.profiler = profiler
+        self.profile = profiler is not None
+        self.allowed_numbers = tuple(allowed_numbers)
+        # Number of worker processes; 0 means one per CPU
+        self.jobs = jobs or os.cpu_count() or 1
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir or os.path.join(directory, '.smellcache')
+        # Results of single functions and classes, so a changed file only has its changed units analyzed again
+        self.unit_cache = None
+        self.unit_cache_path = os.path.join(self.cache_dir, 'units.json') if use_cache else None
+        # None keeps the cache's own size limit
+        self.cache_max_bytes = cache_max_bytes
+        # Per-file budgets of the AST rules; None turns a budget off. The memory budget applies to each worker
+        self.ast_max_bytes = ast_max_bytes
+        self.ast_memory_mb = ast_memory_mb
+        self.ast_timeout = ast_timeout
+        # Absolute path -> changed (first, last) line ranges, when only the changes of a diff are reported
+        self.changed_lines = changed_lines
+        # Whether files also report their metrics; a scan then gathers them in self.metrics, a metrics_report.RepoMetrics
+        self.collect_metrics = collect_metrics
+        self.metrics = None
+        self.smell_count = 0
+        # Progress of the running scan, readable from another thread
+        self.files_total = 0
+        self.files_done = 0
+
+    @classmethod
+    def from_config(cls, directory, config=None, **options):
+        """Build a detector with the file discovery, rules, allowed numbers and AST budgets of the pyproject.toml in directory, or of an
+        already loaded config table; keyword arguments take precedence. Raises ValueError for invalid settings."""
+        if config is None:
+            config = load_config(directory)
+        settings = {'file_finder': FileFinder.from_config(directory, config), 'rules': RuleSet.from_config(config),
+                    'allowed_numbers': config_allowed_numbers(config)}
+        settings.update(config_budgets(config))
+        settings.update(options)
+        return cls(directory, **settings)
+
+    def __getstate__(self):
+        # Worker processes only need to know whether to time; the profiler's hooks stay in this process
+        state = self.__dict__.copy()
+        state['profiler'] = None
+        # Nor do they get the unit cache; init_pool_worker has each of them load its own copy from unit_cache_path
+        state['unit_cache'] = None
+        # The metrics gathered so far belong to the scan, which keeps adding to them here
+        state['metrics'] = None
+        return state
+
+    def config_key(self):
+        # Everything besides the file itself that decides what a scan reports
+        key = (f"{DETECTOR_VERSION}:{self.rules.key()}:{sorted(self.allowed_numbers)}:"
+               f"{self.ast_max_bytes}:{self.ast_memory_mb}:{self.ast_timeout}")
+        # Results without metrics can't serve a scan that collects them
+        return key + ':metrics' if self.collect_metrics else key
+
+    def find_python_files(self):
+        return self.file_finder.find()
+
+    def iter_smells(self):
+        """Yield findings in file order as soon as each file has been analyzed.
+
+        Inheritance depth, coupling and duplicated code can only be judged once every file is
+        indexed, so those findings come last. A diff scan only sees the changed files and leaves them out.
+        """
+        self.smell_count = 0
+        file_paths = list(self.find_python_files())
+        self.files_total = len(file_paths)
+        self.files_done = 0
+        clone_index = CloneIndex()
+        hierarchy = ClassHierarchy(self.directory)
+        if self.collect_metrics:
+            from metrics_report import RepoMetrics
+            self.metrics = RepoMetrics()
+
+        for finding in skipped_findings(self.file_finder):
+            self.smell_count += 1
+            yield finding
+
+        for file_path, result in zip(file_paths, self.iter_file_results(file_paths)):
+            self.files_done += 1
+            clone_index.add(file_path, result.fingerprints)
+            hierarchy.update(file_path, result.classes)
+            if result.metrics is not None:
+                self.metrics.add(file_path, result.metrics, len(result.findings))
+            if result.timer is not None:
+                self.profiler.add_file(file_path, result.timer)
+            for finding in result.findings:
+                self.smell_count += 1
+                yield finding
+
+        if self.changed_lines is not None:
+            classes, clones = [], []
+        elif self.profiler is None:
+            classes = hierarchy_findings(hierarchy, self.rules.thresholds)
+            clones = clone_index.find_clones()
+        else:
+            timer = RuleTimer()
+            with timer.measure('class_hierarchy'):
+                classes = hierarchy_findings(hierarchy, self.rules.thresholds)
+            with timer.measure('clone_index'):
+                clones = clone_index.find_clones()
+            self.profiler.add_timer(timer)
+        if self.profiler is not None:
+            self.profiler.finish()
+
+        for finding in classes:
+            self.smell_count += 1
+            yield finding
+        for clone in clones:
+            self.smell_count += 1
+            yield clone_finding(clone)
 
-    def check_classes(self, tree, file_path):
-        global code_smell_count
-        issues = []
+    def scan_for_smells(self):
+        return [str(finding) for finding in self.iter_smells()]
+
+    def iter_file_results(self, file_paths):
+        cache = None
+        if self.use_cache:
+            # The cache needs sqlite3, hashlib and json, so it is only imported when it is used
+            from smell_cache import DEFAULT_MAX_BYTES, open_cache
+            cache = open_cache(self.cache_dir, self.config_key(), self.cache_max_bytes or DEFAULT_MAX_BYTES)
+        if cache is None:
+            yield from self.iter_analyzed(file_paths)
+            return
+
+        # Unchanged files are served from the cache, only the rest are analyzed
+        with cache:
+            try:
+                yield from self.iter_cached(cache, file_paths)
+            finally:
+                # Also when the caller stops early, as zip() does after the last file
+                self.save_units()
+
+    def iter_cached(self, cache, file_paths):
+        keys = [cache.key(file_path) for file_path in file_paths]
+        hits = [key is not None and cache.contains(key) for key in keys]
+        analyzed = self.iter_analyzed([file_path for file_path, hit in zip(file_paths, hits) if not hit])
+        yield from iter_cached(cache, keys, hits, analyzed)
+
+    def save_units(self):
+        if self.unit_cache is not None:
+            try:
+                self.unit_cache.save(self.unit_cache_path)
+            except OSError:
+                # Like the result cache, it is only an optimization; a read-only checkout just does without
+                pass
+
+    def iter_analyzed(self, file_paths):
+        return iter_analyzed((self,), [(0, file_path) for file_path in file_paths], self.jobs)
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ClassDef):
-                # Research paper metric: "Large Class" threshold = 200 lines or NOA+NOM > 40
-                class_loc = sum(1 for n in node.body if isinstance(n, (ast.FunctionDef, ast.Assign)))
-                num_attributes = sum(1 for n in node.body if isinstance(n, ast.Assign))
-                num_methods = sum(1 for n in node.body if isinstance(n, ast.FunctionDef))
-                if class_loc > 200 or (num_attributes + num_methods) > 40:
-                    issues.append(f"Large class: {node.name} in {file_path} (LOC: {class_loc}, NOA+NOM: {num_attributes + num_methods})")
-                    code_smell_count += 1
-
-                # Research paper metric: "Long Base Class List" threshold = 3
-                if len(node.bases) > 3:
-                    issues.append(f"Long base class list: {node.name} in {file_path}")
-                    code_smell_count += 1
+    def analyze_file(self, file_path):
+        return self.analyze(file_path).findings
 
-        return issues
+    def analyze(self, file_path, data=None):
+        """Analyze one file; data, when given, is its source in place of what is on disk."""
+        if not self.profile:
+            return self.analyze_with_timer(file_path, None, data)
 
-    def check_complexity(self, file_path):
-        global code_smell_count
-        issues = []
+        timer = RuleTimer()
+        start = perf_counter()
+        result = self.analyze_with_timer(file_path, timer, data)
+        timer.total = perf_counter() - start
+        return result
 
+    def analyze_with_timer(self, file_path, timer, data=None):
         try:
-            with open(file_path, 'r', errors='ignore', encoding='utf-8') as file:
-                content = file.read()
-                # Research paper metric: "Cognitive Complexity" threshold = 8
-                results = radon_complexity.cc_visit(content)
-                for result in results:
-                    if result.complexity > 8:
-                        issues.append(f"High complexity: {result.name} in {file_path} with complexity {result.complexity}")
-                        code_smell_count += 1
-
+            size = os.path.getsize(file_path) if data is None else len(data)
+            skipped = self.ast_budget_finding(file_path, size)
+            if skipped is None:
+                try:
+                    with deadline(self.ast_timeout):
+                        return self.analyze_in_memory(file_path, timer, data)
+                except AnalysisTimeout:
+                    skipped = Finding('AST_SKIPPED', file_path, 0, 0, '', (
+                        ('reason', 'time'), ('size', size), ('limit', self.ast_timeout)))
+                except MemoryError:
+                    skipped = Finding('AST_SKIPPED', file_path, 0, 0, '', (
+                        ('reason', 'memory'), ('size', size), ('limit', self.ast_memory_limit())))
+                except RecursionError:
+                    # Deeply nested generated code, such as a huge literal
+                    skipped = Finding('AST_SKIPPED', file_path, 0, 0, '', (
+                        ('reason', 'depth'), ('size', size), ('limit', sys.getrecursionlimit())))
+            return self.analyze_streaming(file_path, timer, skipped, data)
         except Exception as e:
-            issues.append(f"Error analyzing complexity for {file_path}: {str(e)}")
-            code_smell_count += 1
-
-        return issues
+            return FileResult([error_finding(file_path, e)], empty_fingerprints(), None, timer)
+
+    def ast_memory_limit(self):
+        return None if self.ast_memory_mb is None else self.ast_memory_mb * 1024 * 1024
+
+    def ast_budget_finding(self, file_path, size):
+        """The AST_SKIPPED finding of a file over the size or memory budget, or None when it fits."""
+        if self.ast_max_bytes is not None and size > self.ast_max_bytes:
+            return Finding('AST_SKIPPED', file_path, 0, 0, '', (('reason', 'size'), ('size', size), ('limit', self.ast_max_bytes)))
+        memory_limit = self.ast_memory_limit()
+        if memory_limit is not None and size * AST_BYTES_PER_SOURCE_BYTE > memory_limit:
+            return Finding('AST_SKIPPED', file_path, 0, 0, '', (
+                ('reason', 'memory'), ('size', size), ('limit', memory_limit), ('estimate', size * AST_BYTES_PER_SOURCE_BYTE)))
+        return None
+
+    def analyze_streaming(self, file_path, timer, skipped, data=None):
+        # Only the lexical rules, streaming over the file; its tree, classes and clones stay unknown
+        context = StreamingContext(file_path, data)
+        lexical_visitor = LexicalVisitor(file_path, self.allowed_numbers, timer=timer, rule_set=self.rules)
+        with (timer or NULL_TIMER).measure('lexical_pass'):
+            lexical = lexical_visitor.run(context)
+        smells = [skipped]
+        for findings in lexical.values():
+            smells.extend(findings)
+        if self.changed_lines is not None:
+            smells = self.in_changed_lines(file_path, smells, {}, lexical_visitor.metric_lines())
+        return FileResult(smells, empty_fingerprints(), None, timer)
+
+    def analyze_in_memory(self, file_path, timer, data=None):
+        smells = []
+        fingerprints = empty_fingerprints()
+        classes = None
+        metrics = None
+        measure = (timer or NULL_TIMER).measure
 
-# General metric
-    def check_for_duplicates(self, content):
-        global code_smell_count
-        issues = []
-        lines = content.split('\n')
-        seen_blocks = set()
-
-        for i in range(len(lines) - 5):
-            block = tuple(lines[i:i+5])
-            if block in seen_blocks:
-                issues.append(f"Duplicated code detected: Block starting at line {i+1}")
-                code_smell_count += 1
+        rules = self.rules
+        try:
+            # Read and parse the file once; every check works from this context.
+            # Disabled rules cost nothing: a file is only parsed, tokenized or walked for the rules that need it
+            smell_visitor = SmellVisitor(file_path, timer=timer, rule_set=rules, collect_metrics=self.collect_metrics)
+            lexical_visitor = LexicalVisitor(file_path, self.allowed_numbers, timer=timer, rule_set=rules)
+            needs_tree = smell_visitor.rules or rules.uses('complexity') or rules.uses('class_hierarchy') or self.collect_metrics
+            with measure('parse'):
+                context = FileContext.from_path(file_path) if data is None else FileContext(file_path, data)
+                if needs_tree:
+                    context.tree
+            if lexical_visitor.needs_tokens or rules.uses('clones'):
+                with measure('tokenize'):
+                    context.tokens
+
+            # One walk of the tree for every AST rule and one pass over the tokens for every lexical rule.
+            # The time of the rules inside is also counted in tree_walk and lexical_pass.
+            findings = {}
+            complexity = []
+            unit_cache = self.units() if needs_tree else None
+            if unit_cache is not None:
+                with measure('units'):
+                    findings, complexity, metrics = self.analyze_units(context, unit_cache, timer)
             else:
-                seen_blocks.add(block)
-
-        return issues
-
-    def check_for_magic_numbers(self, content):
-        global code_smell_count
-        issues = []
-        lines = content.split('\n')
-
-        for line_num, line in enumerate(lines, start=1):
-            if any(char.isdigit() for char in line):
-                issues.append(f"Potential magic number detected at line {line_num}")
-                code_smell_count += 1
-
-        return issues
-
-    def check_for_deep_inheritance(self, tree):
-        global code_smell_count
+                if smell_visitor.rules or self.collect_metrics:
+                    with measure('tree_walk'):
+                        findings = smell_visitor.run(context.tree)
+                if rules.uses('complexity'):
+                    with measure('complexity'):
+                        complexity = self.check_complexity(context)
+                if self.collect_metrics:
+                    with measure('metrics'):
+                        metrics = self.file_metrics(context, smell_visitor)
+            with measure('lexical_pass'):
+                lexical = lexical_visitor.run(context)
+
+            # Reported in the order: functions and classes, complexity, the lexical rules, the other AST rules
+            smells.extend(findings.get('functions', ()))
+            smells.extend(findings.get('classes', ()))
+            smells.extend(complexity)
+            for group in LEXICAL_RULES:
+                smells.extend(lexical.get(group, ()))
+            for group in TREE_RULES[2:]:
+                smells.extend(findings.get(group, ()))
+
+            if rules.uses('clones'):
+                with measure('fingerprint'):
+                    fingerprints = self.fingerprint(context)
+            if rules.uses('class_hierarchy'):
+                with measure('class_summary'):
+                    classes = summarize_module(context.tree)
+            if self.changed_lines is not None:
+                smells = self.in_changed_lines(file_path, smells, node_spans(context.tree) if needs_tree else {},
+                                               lexical_visitor.metric_lines())
+
+        except (MemoryError, RecursionError):
+            # Falls back to the streaming analysis
+            raise
+        except Exception as e:
+            smells.append(error_finding(file_path, e))
+
+        return FileResult(smells, fingerprints, classes, timer, metrics)
+
+    def units(self):
+        """The UnitCache of this detector, loaded on first use, or None when results are not cached."""
+        if self.unit_cache is None and self.unit_cache_path is not None:
+            from unit_cache import UnitCache
+            self.unit_cache = UnitCache.load(self.unit_cache_path, self.config_key())
+        return self.unit_cache
+
+    def add_units(self, units):
+        """Keep the (key, UnitResult) pairs a pool worker analyzed, so the next save_units() writes them."""
+        unit_cache = self.units()
+        for key, result in units:
+            unit_cache.put(key, result)
+
+    def analyze_units(self, context, unit_cache, timer):
+        """(tree rule findings by group, complexity findings, FileMetrics or None) of a file, put together from its units.
+
+        Every top-level function and class is looked up in unit_cache by the hash of its source and only
+        analyzed when it is not there; the other top-level statements are analyzed together each time.
+        Cached lines are relative to the unit, so they are re-based onto where the unit is now, and the
+        results are merged back into the order a walk of the whole tree gives.
+        """
+        from unit_cache import unit_key
+        tree = context.tree
+        starts = [first_line(statement) for statement in tree.body]
+        parts = []
+        rest = []
+        for index, statement in enumerate(tree.body):
+            if not isinstance(statement, UNIT_TYPES):
+                rest.append(statement)
+                continue
+            first = starts[index]
+            key = unit_key('\n'.join(context.lines[first - 1:statement.end_lineno]))
+            result = unit_cache.get(key)
+            if result is None:
+                result = self.analyze_unit(context.path, [statement], first, timer)
+                # Results radon failed on are not kept, so the unit is tried again
+                if result.error is None:
+                    unit_cache.put(key, result)
+            parts.append((index, first, result))
+        if rest:
+            parts.append((None, 0, self.analyze_unit(context.path, rest, 0, timer)))
+
+        # One walk visits the nodes of all units at one depth before going deeper, and within a depth
+        # goes through the top-level statements in order; a unit's own walk keeps its order otherwise
+        findings = {}
+        complexity = []
+        functions = []
+        classes = []
+        errors = []
+        for index, base, result in parts:
+            def statement_of(line):
+                return index if index is not None else bisect_right(starts, line) - 1
+
+            for order, (group, depth, rule, line, column, symbol, metrics) in enumerate(result.findings):
+                line += base
+                finding = Finding(rule, context.path, line, column, symbol, tuple(map(tuple, metrics)))
+                findings.setdefault(group, []).append(((depth, statement_of(line), order), finding))
+            # radon lists every function before the classes and their methods
+            for order, (kind, line, column, name, value) in enumerate(result.complexity):
+                complexity.append(((kind, statement_of(line + base), order), (line + base, column, name, value)))
+            for order, (depth, name, line, *values) in enumerate(result.functions):
+                functions.append(((depth, statement_of(line + base), order), (name, line + base, *values)))
+            for order, (depth, name, line, *values) in enumerate(result.classes):
+                classes.append(((depth, statement_of(line + base), order), (name, line + base, *values)))
+            if result.error is not None:
+                errors.append(result.error)
+
+        def in_order(items):
+            return [item for key, item in sorted(items, key=itemgetter(0))]
+
+        findings = {group: in_order(items) for group, items in findings.items()}
+        complexity_findings = []
+        limits = self.rules.thresholds.get('HIGH_COMPLEXITY')
+        if limits is not None:
+            if errors:
+                complexity_findings.append(Finding('COMPLEXITY_ERROR', context.path, 0, 0, '', (('error', errors[0]),)))
+            else:
+                complexity_findings.extend(
+                    Finding('HIGH_COMPLEXITY', context.path, line, column, name, (('complexity', value),))
+                    for line, column, name, value in in_order(complexity) if value > limits['complexity']
+                )
+        metrics = None
+        if self.collect_metrics:
+            from metrics_report import FileMetrics
+            loc = len(context.lines) - (context.lines[-1] == '')
+            metrics = FileMetrics(loc, tuple(in_order(functions)), tuple(in_order(classes)))
+        return findings, complexity_findings, metrics
+
+    def analyze_unit(self, file_path, statements, base, timer):
+        """The UnitResult of top-level statements, with lines relative to base."""
+        from unit_cache import UnitResult
+        module = ast.Module(body=statements, type_ignores=[])
+        visitor = SmellVisitor(file_path, timer=timer, rule_set=self.rules, collect_metrics=self.collect_metrics, track_depth=True)
+        if visitor.rules or self.collect_metrics:
+            visitor.run(module)
+        findings = tuple(
+            (group, depth, finding.rule, finding.line - base, finding.column, finding.symbol, finding.metrics)
+            for group in visitor.rules
+            for finding, depth in zip(visitor.findings[group], visitor.finding_depths[group])
+        )
+
+        blocks = []
+        error = None
+        if 'HIGH_COMPLEXITY' in self.rules.thresholds or self.collect_metrics:
+            try:
+                from radon.visitors import ComplexityVisitor
+                complexity_visitor = ComplexityVisitor.from_ast(module)
+                # The order of ComplexityVisitor.blocks
+                blocks = [(0, block) for block in complexity_visitor.functions]
+                for class_block in complexity_visitor.classes:
+                    blocks.append((1, class_block))
+                    blocks.extend((1, method) for method in class_block.methods)
+            except Exception as e:
+                error = str(e)
+        complexity = tuple((kind, block.lineno - base, block.col_offset, block.name, block.complexity) for kind, block in blocks)
+
+        functions = classes = ()
+        if self.collect_metrics:
+            paths = {(block.lineno, block.col_offset): block.complexity for kind, block in blocks}
+            functions = tuple(
+                (visitor.node_depths[node], node.name, node.lineno - base, node.end_lineno - node.lineno + 1,
+                 paths.get((node.lineno, node.col_offset), 1), metrics.atfd, metrics.laa)
+                for node, metrics in visitor.function_metrics.items()
+            )
+            class_rows = []
+            for node, metrics in visitor.class_metrics.items():
+                atfd, tcc = visitor.class_coupling(metrics)
+                class_rows.append((visitor.node_depths[node], node.name, node.lineno - base, node.end_lineno - node.lineno + 1,
+                                   metrics.wmc, atfd, tcc, metrics.noa + metrics.nom))
+            classes = tuple(class_rows)
+        return UnitResult(findings, complexity, functions, classes, error)
+
+    def file_metrics(self, context, visitor):
+        """Size, complexity and coupling of every function and class of a file, from a visitor that collected metrics."""
+        from metrics_report import FileMetrics
+        try:
+            complexity = {(block.lineno, block.col_offset): block.complexity for block in context.complexity_blocks}
+        except Exception:
+            # Without radon's results every function counts as a single path
+            complexity = {}
+
+        functions = tuple(
+            (node.name, node.lineno, node.end_lineno - node.lineno + 1, complexity.get((node.lineno, node.col_offset), 1),
+             metrics.atfd, metrics.laa)
+            for node, metrics in visitor.function_metrics.items()
+        )
+        classes = []
+        for node, metrics in visitor.class_metrics.items():
+            atfd, tcc = visitor.class_coupling(metrics)
+            classes.append((node.name, node.lineno, node.end_lineno - node.lineno + 1, metrics.wmc, atfd, tcc,
+                            metrics.noa + metrics.nom))
+        loc = len(context.lines) - (context.lines[-1] == '')
+        return FileMetrics(loc, functions, tuple(classes))
+
+    def in_changed_lines(self, file_path, smells, spans, metric_lines):
+        """The findings of a diff scan that touch a changed line.
+
+        A function or class counts as changed when any line of it does, decorators included; other
+        findings only when their own line does. A finding about the whole file counts in a new file, or
+        when a changed line is one of those metric_lines gives for its rule, such as an added import on
+        top of too many. Findings that a changed file could not be fully analyzed are always kept.
+        """
+        from git_diff import WHOLE_FILE, overlaps
+        ranges = self.changed_lines.get(os.path.realpath(file_path))
+        if ranges is None:
+            return smells
+        new_file = ranges == WHOLE_FILE
+        kept = []
+        for smell in smells:
+            if not smell.line:
+                lines = metric_lines.get(smell.rule)
+                if new_file or lines is None or any(overlaps(ranges, line, line) for line in lines):
+                    kept.append(smell)
+                continue
+            first = last = smell.line
+            if smell.rule in NODE_RULES:
+                first, last = spans.get((smell.line, smell.column), (first, last))
+            if overlaps(ranges, first, last):
+                kept.append(smell)
+        return kept
+
+    def fingerprint(self, context):
+        return fingerprint_tokens(context.tokens)
+
+    def run_tree_rules(self, context, rules=None):
+        findings = SmellVisitor(context.path, rules, rule_set=self.rules).run(context.tree)
+        # Groups whose rules are all disabled report nothing
+        return {rule: findings.get(rule, []) for rule in rules or TREE_RULES}
+
+    def run_lexical_rules(self, context, rules=None):
+        findings = LexicalVisitor(context.path, self.allowed_numbers, rules, rule_set=self.rules).run(context)
+        return {rule: findings.get(rule, []) for rule in rules or LEXICAL_RULES}
+
+    def check_functions(self, context):
+        return self.run_tree_rules(context, ['functions'])['functions']
+
+    def check_classes(self, context):
+        return self.run_tree_rules(context, ['classes'])['classes']
+
+    def check_complexity(self, context):
         issues = []
+        file_path = context.path
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ClassDef) and len(node.bases) > 3:
-                issues.append(f"Deep inheritance chain in class {node.name}")
-                code_smell_count += 1
-
-        return issues
+        limits = self.rules.thresholds.get('HIGH_COMPLEXITY')
+        if limits is None:
+            return issues
 
-    def check_excessive_comments(self, content, file_path):
-        global code_smell_count
-        issues = []
+        try:
+            # Research paper metric: "Cognitive Complexity" threshold = 8
+            for result in context.complexity_blocks:
+                if result.complexity > limits['complexity']:
+                    issues.append(Finding('HIGH_COMPLEXITY', file_path, result.lineno, result.col_offset, result.name, (('complexity', result.complexity),)))
 
-        # Research paper metric: Excessive comments threshold = 20
-        comment_count = content.count("#")
-        if comment_count > 20:
-            issues.append(f"Excessive comments in {file_path} (more than 20 comments)")
-            code_smell_count += 1
+        except Exception as e:
+            issues.append(Finding('COMPLEXITY_ERROR', file_path, 0, 0, '', (('error', str(e)),)))
 
         return issues
 
 # General metric
-    def check_unnecessary_imports(self, content, file_path):
-        global code_smell_count
-        issues = []
-
-        lines = content.split('\n')
-        imported_modules = set()
-
-        for line in lines:
-            if line.startswith("import ") or line.startswith("from "):
-                imported_modules.add(line.strip())
-
-        if len(imported_modules) > 15:
-            issues.append(f"Unnecessary number of imports in {file_path}")
-            code_smell_count += 1
-
-        return issues
-
-    def check_long_lines(self, content, file_path):
-        global code_smell_count
-        issues = []
-
-        lines = content.split('\n')
-        for i, line in enumerate(lines, start=1):
-            # Research paper metric: Long line threshold = 80 characters
-            if len(line) > 80:
-                issues.append(f"Long line detected in {file_path} at line {i}")
-                code_smell_count += 1
+    def check_for_duplicates(self, context):
+        # Clones within this one file; a scan indexes every file to find clones across files too
+        clone_index = CloneIndex()
+        clone_index.add(context.path, self.fingerprint(context))
+        return [clone_finding(clone) for clone in clone_index.find_clones()]
 
-        return issues
+    def check_for_magic_numbers(self, context):
+        return self.run_lexical_rules(context, ['magic_numbers'])['magic_numbers']
 
-  # Did not need research paper for this one 
-    def check_unreachable_code(self, tree, file_path):
-        global code_smell_count
-        issues = []
+    def check_for_deep_inheritance(self, context):
+        # Only the classes of this one file; a scan indexes every file to follow hierarchies across modules
+        hierarchy = ClassHierarchy(self.directory)
+        hierarchy.update(context.path, summarize_module(context.tree))
+        return [finding for finding in hierarchy_findings(hierarchy, self.rules.thresholds) if finding.rule == 'DEEP_INHERITANCE']
 
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                has_return = False
-                for stmt in node.body:
-                    if isinstance(stmt, ast.Return):
-                        has_return = True
-                    elif has_return:
-                        issues.append(f"Unreachable code after return in function {node.name} in {file_path}")
-                        code_smell_count += 1
-                        break
+    def check_excessive_comments(self, context):
+        return self.run_lexical_rules(context, ['excessive_comments'])['excessive_comments']
 
-        return issues
+    def check_unnecessary_imports(self, context):
+        return self.run_lexical_rules(context, ['unnecessary_imports'])['unnecessary_imports']
 
-    def check_naming_conventions(self, tree, file_path):
-        global code_smell_count
-        issues = []
+    def check_long_lines(self, context):
+        return self.run_lexical_rules(context, ['long_lines'])['long_lines']
 
-        # Check for PEP8 non-compliance in variable/function names
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                if not node.name.islower() or '_' not in node.name:
-                    issues.append(f"Non-PEP8 compliant function name: {node.name} in {file_path}")
-                    code_smell_count += 1
-            elif isinstance(node, ast.Name):
-                if not node.id.islower() or '_' not in node.id:
-                    issues.append(f"Non-PEP8 compliant variable name: {node.id} in {file_path}")
-                    code_smell_count += 1
+    def check_unreachable_code(self, context):
+        return self.run_tree_rules(context, ['unreachable_code'])['unreachable_code']
 
-        return issues
+    def check_naming_conventions(self, context):
+        return self.run_tree_rules(context, ['naming_conventions'])['naming_conventions']
 
-    def check_useless_exception_handling(self, tree, file_path):
-        global code_smell_count
-        issues = []
+    def check_useless_exception_handling(self, context):
+        return self.run_tree_rules(context, ['useless_exception_handling'])['useless_exception_handling']
 
-        # Research paper metric: "Useless Exception Handling" NEC = 1 and NGEC = 1 or NEEC = NEEC
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Try):
-                except_count = len(node.handlers)
-                general_except_count = sum(1 for handler in node.handlers if handler.type is None)
-                if except_count == 1 and general_except_count == 1:
-                    issues.append(f"Useless exception handling in {file_path}")
-                    code_smell_count += 1
+    def check_list_comprehension_complexity(self, context):
+        return self.run_tree_rules(context, ['list_comprehension_complexity'])['list_comprehension_complexity']
 
-        return issues
+    def check_functional_decomposition(self, context):
+        return self.run_tree_rules(context, ['functional_decomposition'])['functional_decomposition']
 
-    def check_list_comprehension_complexity(self, tree, file_path):
-        global code_smell_count
-        issues = []
+    def check_spaghetti_code(self, context):
+        return self.run_tree_rules(context, ['spaghetti_code'])['spaghetti_code']
 
-        # Research paper metric: "Complex List Comprehension" NOL + NOCC >= 4
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ListComp):
-                num_loops = sum(1 for gen in node.generators if isinstance(gen, ast.comprehension))
-                num_conditions = sum(1 for gen in node.generators if gen.ifs)
-                if num_loops + num_conditions >= 4:
-                    issues.append(f"Complex list comprehension in {file_path} at line {node.lineno}")
-                    code_smell_count += 1
+    def check_feature_envy(self, context):
+        return self.run_tree_rules(context, ['feature_envy'])['feature_envy']
 
-        return issues
+    def check_god_class(self, context):
+        return self.run_tree_rules(context, ['god_class'])['god_class']
 
-    def check_functional_decomposition(self, tree, file_path):
-        global code_smell_count
-        issues = []
+    def get_smells_count(self):
+        return self.smell_count
 
-        # Research paper metric: Functional Decomposition LOCMETHOD >= 151
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                loc_method = len(node.body)
-                if loc_method >= 151:
-                    issues.append(f"Functional decomposition detected in method {node.name} in {file_path}")
-                    code_smell_count += 1
 
-        return issues
+def first_line(statement):
+    # Decorators come before the def or class line
+    return min([statement.lineno] + [decorator.lineno for decorator in getattr(statement, 'decorator_list', ())])
 
-    def check_spaghetti_code(self, tree, file_path):
-        global code_smell_count
-        issues = []
 
-        # Research paper metric: Spaghetti Code NPRIVFIELD >= 7 and NMD = 16
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ClassDef):
-                private_fields = sum(1 for n in node.body if isinstance(n, ast.Assign) and any(t.id.startswith('_') for t in n.targets if isinstance(t, ast.Name)))
-                num_methods = sum(1 for n in node.body if isinstance(n, ast.FunctionDef))
-                if private_fields >= 7 and num_methods == 16:
-                    issues.append(f"Spaghetti code detected in class {node.name} in {file_path}")
-                    code_smell_count += 1
+def node_spans(tree):
+    # (line, column) of every function and class -> its (first, last) line, decorators included
+    spans = {}
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            spans[(node.lineno, node.col_offset)] = (first_line(node), node.end_lineno)
+    return spans
 
-        return issues
 
-    def check_feature_envy(self, tree, file_path):
-        global code_smell_count
-        issues = []
-
-        # Research paper metric: Feature Envy FDP <= 5 and ATFD > 5 and LAA < 1/3
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                foreign_data_accesses = 0
-                local_data_accesses = 0
-                foreign_classes = set()
-
-                for n in ast.walk(node):
-                    if isinstance(n, ast.Attribute):
-                        if isinstance(n.value, ast.Name) and n.value.id != 'self':
-                            foreign_data_accesses += 1
-                            foreign_classes.add(n.value.id)
-                        elif isinstance(n.value, ast.Name) and n.value.id == 'self':
-                            local_data_accesses += 1
-
-                fdp = len(foreign_classes)
-                atfd = foreign_data_accesses
-                laa = local_data_accesses / (local_data_accesses + foreign_data_accesses) if (local_data_accesses + foreign_data_accesses) > 0 else 0
-
-                if fdp <= 5 and atfd > 5 and laa < 1/3:
-                    issues.append(f"Feature Envy detected in method {node.name} in {file_path}")
-                    code_smell_count += 1
-
-        return issues
-
-    def check_god_class(self, tree, file_path):
-        global code_smell_count
-        issues = []
+def file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
 
-        # Research paper metric: God Class WMC >= 47, ATFD > 5, TCC < 1/3
-        for node in ast.walk(tree):
-            if isinstance(node, ast.ClassDef):
-                wmc = 0
-                atfd = 0
-                total_methods = 0
-                connected_methods = 0
-
-                methods = [n for n in node.body if isinstance(n, ast.FunctionDef)]
-                total_methods = len(methods)
-                shared_attributes = set()
-
-                for method in methods:
-                    method_complexity = len(method.body)
-                    wmc += method_complexity
-
-                    for n in ast.walk(method):
-                        if isinstance(n, ast.Attribute) and isinstance(n.value, ast.Name) and n.value.id != 'self':
-                            atfd += 1
-                        if isinstance(n, ast.Attribute) and isinstance(n.value, ast.Name) and n.value.id == 'self':
-                            shared_attributes.add(n.attr)
-
-                for method in methods:
-                    for n in ast.walk(method):
-                        if isinstance(n, ast.Attribute) and n.attr in shared_attributes:
-                            connected_methods += 1
-                            break
-
-                tcc = connected_methods / total_methods if total_methods > 0 else 0
-
-                if wmc >= 47 and atfd > 5 and tcc < 1/3:
-                    issues.append(f"God Class detected: {node.name} in {file_path}")
-                    code_smell_count += 1
+# Main function representation
+def main(argv=None):
+    """Command line entry point; returns the exit status.
+
+    `python -m code_smells_detection` starts faster than running this file as a script, since Python
+    only reuses the compiled bytecode of imported modules.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scan a directory for Python code smells.")
+    parser.add_argument("paths", nargs="*", help="directories or files to scan (default: the current directory)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes to use, 0 for one per CPU (default: 1)")
+    parser.add_argument("--no-cache", action="store_true", help="analyze every file instead of reusing results from .smellcache/")
+    parser.add_argument("--profile", action="store_true", help="report time and calls per rule and the slowest files")
+    parser.add_argument("--profile-top", type=int, default=10, metavar="N", help="number of slowest files to report (default: 10)")
+    parser.add_argument("--profile-dump", metavar="FILE", help="also run the scan under cProfile and write pstats data to FILE")
+    parser.add_argument("--prometheus-textfile", metavar="FILE", help="write the profile as Prometheus metrics to FILE (implies --profile)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="report percentiles and outliers of file, class and function metrics (LOC, CC, WMC, ATFD, TCC, LAA, NOA+NOM) and the top hotspots")
+    parser.add_argument("--metrics-top", type=int, default=10, metavar="N", help="number of hotspots to report per level (default: 10)")
+    parser.add_argument("--include", action="append", metavar="GLOB", help="scan only files matching GLOB (default: *.py); repeatable")
+    parser.add_argument("--exclude", action="append", metavar="GLOB", help="skip files and directories matching GLOB; repeatable")
+    parser.add_argument("--git-files", action="store_true", default=None, help="list files with git ls-files instead of walking the directory")
+    parser.add_argument("--no-gitignore", dest="gitignore", action="store_false", default=None, help="do not honor .gitignore files")
+    parser.add_argument("--max-file-size", type=int, metavar="BYTES", help="skip files larger than BYTES")
+    parser.add_argument("--include-generated", dest="skip_generated", action="store_false", default=None,
+                        help="also scan files marked as generated")
+    parser.add_argument("--select", metavar="RULES", help="run only these comma-separated rules, e.g. C901,LONG_LINE (default: all)")
+    parser.add_argument("--ignore", metavar="RULES", help="do not run these comma-separated rules")
+    parser.add_argument("--config", metavar="FILE",
+                        help="read settings and thresholds from FILE, a pyproject.toml or TOML profile, instead of the scanned directory's pyproject.toml")
+    parser.add_argument("--list-rules", action="store_true", help="list the rules with their thresholds and exit")
+    parser.add_argument("--ast-max-size", type=int, metavar="BYTES",
+                        help=f"run only the lexical rules on files larger than BYTES, 0 for no limit (default: {DEFAULT_AST_MAX_BYTES})")
+    parser.add_argument("--ast-memory", type=int, metavar="MB",
+                        help=f"run only the lexical rules on files whose tree would take more than MB, 0 for no limit (default: {DEFAULT_AST_MEMORY_MB})")
+    parser.add_argument("--ast-timeout", type=float, metavar="SECONDS",
+                        help=f"stop the AST rules of a file after SECONDS, 0 for no limit (default: {DEFAULT_AST_TIMEOUT})")
+    parser.add_argument("--diff", metavar="REF",
+                        help="only analyze files changed since REF, e.g. origin/main, and only report findings on changed lines; exit with 1 if there are any")
+    parser.add_argument("--save-findings", metavar="FILE", help="store the findings in FILE, for use as a later --baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="only report findings that are not in the stored FILE, and exit with 1 if there are any")
+    parser.add_argument("--watch", action="store_true", help="keep running and re-analyze files as they change")
+    parser.add_argument("--watch-socket", metavar="ADDRESS", help="also publish watch updates as JSON lines on HOST:PORT or a Unix socket path")
+    parser.add_argument("--serve", metavar="ADDRESS", help="serve an HTTP/JSON API on HOST:PORT or a Unix socket path, analyzing files on --jobs workers")
+    parser.add_argument("--max-queued", type=int, default=64, metavar="N", help="files the service queues before answering 503 (default: 64)")
+    args = parser.parse_args(argv)
+
+    if args.list_rules:
+        for rule in RULES.values():
+            thresholds = ', '.join(f"{name} = {value:g}" for name, value in rule.thresholds.items())
+            print(f"{rule.id:28} {thresholds}")
+        return 0
+
+    profiler = None
+    if args.profile or args.prometheus_textfile:
+        profiler = Profiler(top=args.profile_top)
+        if args.prometheus_textfile:
+            profiler.add_hook(PrometheusTextfileExporter(args.prometheus_textfile))
+
+    # A single directory is scanned as a whole. Files and several paths, e.g. from a pre-commit hook,
+    # are scanned from the current directory, whose pyproject.toml and cache they use
+    if len(args.paths) == 1 and os.path.isdir(args.paths[0]):
+        directory, paths = args.paths[0], None
+    else:
+        directory, paths = os.curdir, args.paths or None
+    # Command line options override the [tool.code-smells] table of the scanned directory's pyproject.toml
+    try:
+        config = load_profile(args.config) if args.config else load_config(directory)
+        rules = RuleSet.from_config(config, args.select, args.ignore)
+        allowed_numbers = config_allowed_numbers(config)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    changed_lines = None
+    if args.diff:
+        # Only the changed files under the scanned paths are analyzed
+        import git_diff
+        try:
+            changed_lines = git_diff.changed_lines(directory, args.diff)
+        except ValueError as e:
+            parser.error(f"--diff {args.diff}: {e}")
+        # git names the changed files by their real paths, so a directory reached through a symlink is resolved too
+        scopes = [os.path.realpath(path) for path in paths or [directory]]
+        paths = [os.path.join(directory, os.path.relpath(path, os.path.realpath(directory))) for path in sorted(changed_lines)
+                 if any(path == scope or path.startswith(scope + os.sep) for scope in scopes)]
+    file_finder = FileFinder.from_config(
+        directory, config, include=args.include, exclude=args.exclude, use_gitignore=args.gitignore, use_git=args.git_files,
+        max_file_size=args.max_file_size, skip_generated=args.skip_generated, paths=paths,
+    )
+    budgets = config_budgets(config, args.ast_max_size, args.ast_memory, args.ast_timeout)
+    # A diff scan reports part of each file's findings, so its results are not cached
+    detector = CodeSmellDetector(directory, jobs=args.jobs, use_cache=not args.no_cache and not args.diff, profiler=profiler,
+                                 file_finder=file_finder, rules=rules, allowed_numbers=allowed_numbers, changed_lines=changed_lines,
+                                 collect_metrics=args.metrics, **budgets)
+
+    if args.serve:
+        from service import serve
+        serve(detector, args.serve, max_pending=args.max_queued)
+        return 0
+
+    if args.watch or args.watch_socket:
+        from watch import watch
+        watch(detector, args.watch_socket)
+        return 0
+
+    # A baseline that can't be read is reported before the scan rather than after it
+    baseline = None
+    if args.baseline:
+        from findings_store import FindingsTable
+        try:
+            baseline = FindingsTable.load(args.baseline)
+        except (OSError, ValueError) as e:
+            parser.error(f"--baseline: {e}")
+
+    # Findings are only kept when they are stored or compared; otherwise they are just printed
+    findings = [] if args.save_findings or args.baseline else None
+
+    # cProfile only sees this process; use --jobs 1 to profile the analysis itself
+    with cprofile_to(args.profile_dump):
+        # Findings are printed as they stream in rather than collected first
+        for smell in detector.iter_smells():
+            if findings is not None:
+                findings.append(smell)
+            if args.baseline:
+                continue
+            if detector.get_smells_count() == 1:
+                print("\nCode smells detected:")
+            print(smell)
 
-        return issues
+    exit_code = 0
+    if findings is not None:
+        from findings_store import FindingsTable
+        table = FindingsTable.from_findings(findings)
+        if args.save_findings:
+            table.save(args.save_findings)
+        if args.baseline:
+            with baseline:
+                new = table.new_since(baseline)
+            if new:
+                print("\nNew code smells since the baseline:")
+                for smell in table.findings(new):
+                    print(smell)
+            print(f"\nNew code smells since the baseline: {len(new)}")
+            exit_code = 1 if new else 0
+    elif args.diff:
+        exit_code = 1 if detector.get_smells_count() else 0
+
+    print(f"\nTotal code smells detected: {detector.get_smells_count()}")
+    if detector.file_finder.generated:
+        print(f"Skipped {detector.file_finder.generated} generated files; scan them with --include-generated "
+              f"or skip-generated = false in pyproject.toml")
+    if detector.metrics is not None:
+        print(detector.metrics.report(top=args.metrics_top))
+    if profiler is not None:
+        print(profiler.report())
+    return exit_code
 
-    def get_smells_count(self):
-        return code_smell_count
 
-# Main function representation
 if __name__ == "__main__":
-    directory = input("Enter the directory to scan for code smells: ")
-    detector = CodeSmellDetector(directory)
-    smells = detector.scan_for_smells()
-
-    if smells:
-        print("\nCode smells detected:")
-        for smell in smells:
-            print(smell)
-
-    print(f"\nTotal code smells detected: {code_smell_count}")
+    sys.exit(main())
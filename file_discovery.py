@@ -0,0 +1,361 @@
+import codecs
+import os
+import re
+from collections import namedtuple
+
+# Directories that hold other people's code or build output; they are pruned without being listed
+DEFAULT_EXCLUDED_DIRS = frozenset({
+    '.git', '.hg', '.svn', '.tox', '.nox', '.venv', 'venv', 'env', '__pycache__', 'node_modules',
+    'site-packages', 'dist-packages', 'build', 'dist', '.eggs', '.mypy_cache', '.pytest_cache',
+    '.ruff_cache', '.smellcache',
+})
+
+DEFAULT_INCLUDE = ('*.py',)
+
+# Tools mark the files they write in the comments that open the file, with @generated or a line such as
+# "Generated by the protocol buffer compiler.  DO NOT EDIT!" or "Code generated by stringer; DO NOT EDIT."
+GENERATED_MARKER = re.compile(rb'@generated\b|\bgenerated\b.*\bdo not edit\b', re.IGNORECASE | re.DOTALL)
+GENERATED_HEAD_BYTES = 512
+
+# One line of a .gitignore file, with its glob already compiled
+IgnoreRule = namedtuple('IgnoreRule', 'regex negate dir_only')
+
+
+def glob_to_regex(pattern):
+    """Translate a gitignore-style glob, where * stays inside one path segment and ** spans segments."""
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif c == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                parts.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1:j].replace('\\', '\\\\')
+            if body[0] in '!^':
+                body = '^' + body[1:]
+            parts.append(f'[{body}]')
+            i = j + 1
+        elif c == '\\' and i + 1 < n:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return ''.join(parts)
+
+
+def path_regex(pattern):
+    # Like git, a pattern without a slash matches at any depth, and one with a slash is relative to its base
+    pattern = pattern.rstrip('/')
+    if '/' in pattern:
+        return glob_to_regex(pattern.lstrip('/'))
+    return '(?:.*/)?' + glob_to_regex(pattern)
+
+
+def compile_globs(patterns):
+    """Combine globs into one regex matched against '/'-separated relative paths, or None for no globs."""
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{path_regex(pattern)})' for pattern in patterns), re.DOTALL)
+
+
+def read_ignore_file(path):
+    try:
+        with open(path, encoding='utf-8', errors='ignore') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return ()
+
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if not line or line.startswith('#'):
+            continue
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        if line.strip('/'):
+            rules.append(IgnoreRule(re.compile(path_regex(line), re.DOTALL), negate, dir_only))
+    return tuple(rules)
+
+
+def is_ignored(rel_path, is_dir, chain):
+    # Deeper .gitignore files win over shallower ones, and within a file the last matching line wins
+    for base, rules in reversed(chain):
+        sub_path = rel_path[len(base) + 1:] if base else rel_path
+        for rule in reversed(rules):
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.fullmatch(sub_path):
+                return not rule.negate
+    return False
+
+
+def load_config(directory):
+    """Return the [tool.code-smells] table of the pyproject.toml in directory, or an empty dict."""
+    path = os.path.join(directory, 'pyproject.toml')
+    if not os.path.isfile(path):
+        return {}
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11 has no TOML parser, so pyproject.toml settings are not read
+        return {}
+    with open(path, 'rb') as file:
+        return tomllib.load(file).get('tool', {}).get('code-smells', {})
+
+
+class FileFinder:
+    """Finds the Python files of a scan, pruning excluded directories before they are ever listed."""
+
+    def __init__(self, directory, include=DEFAULT_INCLUDE, exclude=(), use_gitignore=True, use_git=False,
+                 max_file_size=None, skip_generated=True, excluded_dirs=DEFAULT_EXCLUDED_DIRS, paths=None):
+        self.directory = directory
+        # Files and directories to search instead of the whole directory, e.g. the files given by a pre-commit hook
+        self.paths = paths
+        self.include = compile_globs(include or DEFAULT_INCLUDE)
+        self.exclude = compile_globs(exclude)
+        self.use_gitignore = use_gitignore
+        self.use_git = use_git
+        self.max_file_size = max_file_size
+        self.skip_generated = skip_generated
+        self.excluded_dirs = frozenset(excluded_dirs)
+        # Files left out by the last search: how many were generated, and the (path, size) of those too large
+        self.generated = 0
+        self.oversized = []
+
+    @classmethod
+    def from_config(cls, directory, config=None, **overrides):
+        """Build a finder from pyproject.toml in directory, or from an already loaded config table;
+        keyword arguments that are not None take precedence."""
+        if config is None:
+            config = load_config(directory)
+        options = {
+            'include': config.get('include', DEFAULT_INCLUDE),
+            'exclude': config.get('exclude', ()),
+            'use_gitignore': config.get('gitignore', True),
+            'use_git': config.get('git-files', False),
+            'max_file_size': config.get('max-file-size'),
+            'skip_generated': config.get('skip-generated', True),
+        }
+        if not config.get('default-excludes', True):
+            options['excluded_dirs'] = ()
+        options.update((name, value) for name, value in overrides.items() if value is not None)
+        return cls(directory, **options)
+
+    def find(self):
+        """Yield the paths of the files to scan."""
+        self.generated = 0
+        self.oversized = []
+        if self.paths is not None:
+            yield from self.find_paths()
+            return
+        if self.use_git:
+            files = self.git_files()
+            if files is not None:
+                yield from files
+                return
+        for directory, files in self.walk():
+            yield from files
+
+    def find_paths(self):
+        for path in self.paths:
+            if os.path.isdir(path):
+                for directory, files in self.walk(path):
+                    yield from files
+            elif os.path.relpath(path, self.directory).startswith(os.pardir):
+                # Files outside the directory have no ignore rules that apply to them
+                if os.path.isfile(path):
+                    yield path
+            elif os.path.isfile(path) and self.matches(path):
+                yield path
+
+    def directories(self):
+        """Yield every directory that is searched, for watchers that need to know them."""
+        for directory, files in self.walk():
+            yield directory
+
+    def walk(self, start=None):
+        """Yield (directory, files to scan) top-down from start, by default the whole directory, in os.walk order."""
+        if start is None:
+            stack = [(self.directory, '', self.root_chain())]
+        else:
+            rel_dir = os.path.relpath(start, self.directory).replace(os.sep, '/')
+            if rel_dir == '.':
+                stack = [(start, '', self.root_chain())]
+            elif rel_dir.startswith('../'):
+                stack = [(start, '', ())]
+            else:
+                parent, _, name = rel_dir.rpartition('/')
+                chain = self.chain_below(parent)
+                if chain is None or self.prunes(name, rel_dir, chain):
+                    return
+                stack = [(start, rel_dir, chain)]
+
+        while stack:
+            directory, rel_dir, chain = stack.pop()
+            chain = self.extend_chain(chain, directory, rel_dir)
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+
+            files = []
+            subdirs = []
+            for entry in entries:
+                rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    # Symlinked directories are not followed, as with os.walk
+                    if not entry.is_symlink() and not self.prunes(entry.name, rel_path, chain):
+                        subdirs.append((entry.path, rel_path, chain))
+                elif self.wants(entry.path, rel_path, chain):
+                    files.append(entry.path)
+
+            yield directory, files
+            stack.extend(reversed(subdirs))
+
+    def git_files(self):
+        import subprocess
+
+        # Untracked files are listed too, so new code is scanned before it is committed
+        try:
+            output = subprocess.run(
+                ['git', '-C', self.directory, 'ls-files', '-z', '--cached', '--others', '--exclude-standard'],
+                capture_output=True, check=True,
+            ).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+        pruned_dirs = {}
+        files = []
+        for rel_path in os.fsdecode(output).split('\0'):
+            if not rel_path or not self.include.fullmatch(rel_path):
+                continue
+            rel_dir = rel_path.rpartition('/')[0]
+            if rel_dir not in pruned_dirs:
+                pruned_dirs[rel_dir] = self.prunes_any(rel_dir)
+            if pruned_dirs[rel_dir]:
+                continue
+            path = os.path.join(self.directory, *rel_path.split('/'))
+            # The index still lists files deleted from the work tree
+            if os.path.isfile(path) and self.wants(path, rel_path, ()):
+                files.append(path)
+        return files
+
+    def matches(self, path):
+        """Whether path would be found by a search, for files that show up after it."""
+        rel_path = os.path.relpath(path, self.directory).replace(os.sep, '/')
+        if rel_path.startswith('../'):
+            return False
+
+        chain = self.chain_below(rel_path.rpartition('/')[0])
+        return chain is not None and self.wants(path, rel_path, chain)
+
+    def chain_below(self, rel_dir):
+        """The .gitignore rules in effect inside rel_dir, or None when rel_dir or one of its parents is pruned."""
+        chain = self.extend_chain(self.root_chain(), self.directory, '')
+        directory = self.directory
+        current = ''
+        for part in rel_dir.split('/') if rel_dir else ():
+            current = f'{current}/{part}' if current else part
+            if self.prunes(part, current, chain):
+                return None
+            directory = os.path.join(directory, part)
+            chain = self.extend_chain(chain, directory, current)
+        return chain
+
+    def root_chain(self):
+        if not self.use_gitignore:
+            return ()
+        rules = read_ignore_file(os.path.join(self.directory, '.git', 'info', 'exclude'))
+        return (('', rules),) if rules else ()
+
+    def extend_chain(self, chain, directory, rel_dir):
+        if not self.use_gitignore:
+            return chain
+        rules = read_ignore_file(os.path.join(directory, '.gitignore'))
+        return chain + ((rel_dir, rules),) if rules else chain
+
+    def prunes(self, name, rel_dir, chain):
+        if name in self.excluded_dirs or name.endswith('.egg-info'):
+            return True
+        if self.exclude is not None and self.exclude.fullmatch(rel_dir):
+            return True
+        return bool(chain) and is_ignored(rel_dir, True, chain)
+
+    def prunes_any(self, rel_dir):
+        prefix = ''
+        for part in rel_dir.split('/') if rel_dir else ():
+            prefix = f'{prefix}/{part}' if prefix else part
+            if self.prunes(part, prefix, ()):
+                return True
+        return False
+
+    def wants(self, path, rel_path, chain):
+        if not self.include.fullmatch(rel_path):
+            return False
+        if self.exclude is not None and self.exclude.fullmatch(rel_path):
+            return False
+        if chain and is_ignored(rel_path, False, chain):
+            return False
+        if self.max_file_size is not None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return False
+            if size > self.max_file_size:
+                self.oversized.append((path, size))
+                return False
+        if self.skip_generated and self.is_generated(path):
+            self.generated += 1
+            return False
+        return True
+
+    def is_generated(self, path):
+        try:
+            with open(path, 'rb') as file:
+                head = file.read(GENERATED_HEAD_BYTES)
+        except OSError:
+            return False
+        return GENERATED_MARKER.search(header_comments(head)) is not None
+
+
+def header_comments(head):
+    """The comment lines a file starts with, up to its first line of code or docstring."""
+    lines = []
+    # bytes.removeprefix() is Python 3.9 and later
+    head = head[3:] if head.startswith(codecs.BOM_UTF8) else head
+    for line in head.splitlines():
+        line = line.strip()
+        if line and not line.startswith(b'#'):
+            break
+        lines.append(line)
+    return b'\n'.join(lines)
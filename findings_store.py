@@ -0,0 +1,251 @@
+import mmap
+import struct
+import sys
+from array import array
+from functools import cached_property
+from code_smells_detection import Finding
+
+MAGIC = b'SMELLS\x00\x01'
+
+# Magic, number of findings, of metric values and of interned strings, and the size of the string data
+HEADER = struct.Struct('<8s4q')
+
+# Kinds of metric values; strings are kept as ids into the string table
+INT, FLOAT, STRING = 0, 1, 2
+
+# (column, typecode, length) in file order; lengths are counted in findings (n), metric values (m) or strings (s)
+COLUMNS = (
+    ('rules', 'i', 'n'),
+    ('paths', 'i', 'n'),
+    ('lines', 'i', 'n'),
+    ('columns', 'i', 'n'),
+    ('symbols', 'i', 'n'),
+    ('metric_starts', 'q', 'n+1'),
+    ('metric_names', 'i', 'm'),
+    ('metric_kinds', 'b', 'm'),
+    ('metric_values', 'd', 'm'),
+    ('string_offsets', 'q', 's+1'),
+)
+
+
+def column_length(length, n, m, s):
+    return {'n': n, 'n+1': n + 1, 'm': m, 's+1': s + 1}[length]
+
+
+def padding(size):
+    # Every column starts on an 8 byte boundary
+    return -size % 8
+
+
+class FindingsTable:
+    """Findings of a scan in columns: integer arrays that point into one table of interned strings.
+
+    Tables are saved to a single file and loaded through mmap, so a stored scan can be queried and
+    compared without turning its rows into Python objects; only the rows asked for become Findings.
+    """
+
+    def __init__(self, columns, string_data, mapping=None):
+        for name, typecode, length in COLUMNS:
+            setattr(self, name, columns[name])
+        self.string_data = string_data
+        self.mapping = mapping
+
+    @classmethod
+    def from_findings(cls, findings):
+        columns = {name: array(typecode) for name, typecode, length in COLUMNS}
+        string_ids = {}
+        strings = []
+
+        def intern(string):
+            string_id = string_ids.get(string)
+            if string_id is None:
+                string_id = string_ids[string] = len(strings)
+                strings.append(string)
+            return string_id
+
+        columns['metric_starts'].append(0)
+        for finding in findings:
+            columns['rules'].append(intern(finding.rule))
+            columns['paths'].append(intern(finding.path))
+            columns['lines'].append(finding.line)
+            columns['columns'].append(finding.column)
+            columns['symbols'].append(intern(finding.symbol))
+            for name, value in finding.metrics:
+                columns['metric_names'].append(intern(name))
+                if isinstance(value, str):
+                    columns['metric_kinds'].append(STRING)
+                    columns['metric_values'].append(intern(value))
+                else:
+                    columns['metric_kinds'].append(FLOAT if isinstance(value, float) else INT)
+                    columns['metric_values'].append(value)
+            columns['metric_starts'].append(len(columns['metric_names']))
+
+        encoded = [string.encode('utf-8', 'surrogateescape') for string in strings]
+        offsets = columns['string_offsets']
+        offsets.append(0)
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        table = cls(columns, b''.join(encoded))
+        table.__dict__['string_ids'] = string_ids
+        return table
+
+    @classmethod
+    def load(cls, path):
+        """Map a saved table into memory; its columns are views of the file rather than copies."""
+        with open(path, 'rb') as file:
+            try:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # An empty file can't be mapped
+                raise ValueError(f"{path} is not a valid findings file") from None
+        view = None
+        columns = {}
+        try:
+            magic, n, m, s, string_size = HEADER.unpack_from(mapping)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a findings file")
+
+            view = memoryview(mapping)
+            offset = HEADER.size + padding(HEADER.size)
+            for name, typecode, length in COLUMNS:
+                count = column_length(length, n, m, s)
+                size = count * array(typecode).itemsize
+                if offset + size > len(view):
+                    raise ValueError(f"{path} is truncated")
+                if sys.byteorder == 'little':
+                    columns[name] = view[offset:offset + size].cast(typecode)
+                else:
+                    # The file is little-endian, so big-endian machines read a swapped copy
+                    columns[name] = array(typecode, view[offset:offset + size].tobytes())
+                    columns[name].byteswap()
+                offset += size + padding(size)
+            if offset + string_size > len(view):
+                raise ValueError(f"{path} is truncated")
+            string_data = view[offset:offset + string_size]
+        except (ValueError, TypeError, struct.error):
+            # Views into the mapping must go before it can be closed, as in close()
+            for column in columns.values():
+                if isinstance(column, memoryview):
+                    column.release()
+            if view is not None:
+                view.release()
+            mapping.close()
+            raise ValueError(f"{path} is not a valid findings file") from None
+        return cls(columns, string_data, mapping)
+
+    def save(self, path):
+        n, m, s = len(self), len(self.metric_names), len(self.string_offsets) - 1
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, n, m, s, len(self.string_data)))
+            file.write(b'\0' * padding(HEADER.size))
+            for name, typecode, length in COLUMNS:
+                column = array(typecode, getattr(self, name))
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                data = column.tobytes()
+                file.write(data)
+                file.write(b'\0' * padding(len(data)))
+            file.write(self.string_data)
+
+    def close(self):
+        if self.mapping is not None:
+            # Views into the mapping must go before it can be closed
+            for name, typecode, length in COLUMNS:
+                column = getattr(self, name)
+                if isinstance(column, memoryview):
+                    column.release()
+            self.string_data.release()
+            self.mapping.close()
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def string(self, string_id):
+        offsets = self.string_offsets
+        return bytes(self.string_data[offsets[string_id]:offsets[string_id + 1]]).decode('utf-8', 'surrogateescape')
+
+    @cached_property
+    def string_ids(self):
+        return {self.string(string_id): string_id for string_id in range(len(self.string_offsets) - 1)}
+
+    def finding(self, index):
+        metrics = []
+        names, kinds, values = self.metric_names, self.metric_kinds, self.metric_values
+        for position in range(self.metric_starts[index], self.metric_starts[index + 1]):
+            kind, value = kinds[position], values[position]
+            if kind == STRING:
+                value = self.string(int(value))
+            elif kind == INT:
+                value = int(value)
+            metrics.append((self.string(names[position]), value))
+        return Finding(self.string(self.rules[index]), self.string(self.paths[index]), self.lines[index],
+                       self.columns[index], self.string(self.symbols[index]), tuple(metrics))
+
+    def findings(self, indexes=None):
+        """Yield the findings at indexes, or all of them, as Finding objects."""
+        for index in range(len(self)) if indexes is None else indexes:
+            yield self.finding(index)
+
+    def query(self, rule=None, path_prefix=None, metric=None, min_value=None, max_value=None):
+        """Return the indexes of the findings that meet every given condition, as an array.
+
+        metric with min_value and/or max_value keeps findings whose numeric metric of that name is in range.
+        """
+        indexes = array('i', range(len(self)))
+
+        if rule is not None:
+            rule_id = self.string_ids.get(rule, -1)
+            rules = self.rules
+            indexes = array('i', (index for index in indexes if rules[index] == rule_id))
+
+        if path_prefix is not None:
+            # Prefixes are checked once per distinct path, not once per finding
+            paths = self.paths
+            path_ids = {path_id for path_id in set(paths) if self.string(path_id).startswith(path_prefix)}
+            indexes = array('i', (index for index in indexes if paths[index] in path_ids))
+
+        if metric is not None:
+            name_id = self.string_ids.get(metric, -1)
+            low = float('-inf') if min_value is None else min_value
+            high = float('inf') if max_value is None else max_value
+            indexes = array('i', (index for index in indexes if self.metric_in_range(index, name_id, low, high)))
+
+        return indexes
+
+    def metric_in_range(self, index, name_id, low, high):
+        names, kinds, values = self.metric_names, self.metric_kinds, self.metric_values
+        for position in range(self.metric_starts[index], self.metric_starts[index + 1]):
+            if names[position] == name_id and kinds[position] != STRING:
+                return low <= values[position] <= high
+        return False
+
+    def new_since(self, baseline):
+        """Return the indexes of the findings that are not in baseline, as an array.
+
+        Findings are matched on rule, path and symbol but not on line, so code that only moved is not
+        reported as new. When a key occurs more often than in the baseline, its later occurrences are the new ones.
+        """
+        # Map this table's string ids to the baseline's; strings the baseline never saw become -1
+        baseline_ids = baseline.string_ids
+        translate = array('i', (baseline_ids.get(self.string(string_id), -1) for string_id in range(len(self.string_offsets) - 1)))
+
+        remaining = {}
+        for key in zip(baseline.rules, baseline.paths, baseline.symbols):
+            remaining[key] = remaining.get(key, 0) + 1
+
+        new = array('i')
+        for index, key in enumerate(zip(self.rules, self.paths, self.symbols)):
+            key = (translate[key[0]], translate[key[1]], translate[key[2]])
+            count = remaining.get(key, 0)
+            if count:
+                remaining[key] = count - 1
+            else:
+                new.append(index)
+        return new
@@ -1,7 +1,17 @@
+import argparse
+import queue
+import threading
 from tkinter import *
-from tkinter import filedialog
+from tkinter import ttk
 from code_smells_detection import CodeSmellDetector
 
+# Findings shown per page of the results view
+PAGE_SIZE = 1000
+
+# How often the GUI polls the scan worker, and how many findings it takes per poll
+POLL_INTERVAL_MS = 100
+BATCH_SIZE = 5000
+
 
 class Frontend:
     def __init__(self, root):
@@ -10,6 +20,14 @@ class Frontend:
         self.root.title("Python Code Smells Detection Software")
         self.file_path = None  # Initialize file_path to None
 
+        # State of the scan running in the background
+        self.worker = None
+        self.detector = None
+        self.cancel_event = threading.Event()
+        self.results = queue.Queue()
+        self.smells = []
+        self.page = 0
+
         # Title Label
         self.title = Label(
             self.root,
@@ -44,7 +62,34 @@ class Frontend:
             bd=0,
             command=self.detect_smells,
         )
-        self.detect_btn.place(x=650, y=300)
+        self.detect_btn.place(x=650, y=290)
+
+        # Cancel Button, only usable while a scan runs
+        self.cancel_btn = Button(
+            self.root,
+            text="Cancel",
+            width=15,
+            height=2,
+            fg="black",
+            bd=0,
+            state=DISABLED,
+            command=self.cancel_scan,
+        )
+        self.cancel_btn.place(x=820, y=290)
+
+        # Progress of the running scan
+        self.progress = ttk.Progressbar(self.root, orient=HORIZONTAL, mode="determinate")
+        self.progress.place(x=350, y=355, width=500)
+        self.status = Label(self.root, text="", font=("Poppins", 11), bg="#EBE6E0", anchor=W)
+        self.status.place(x=860, y=352, width=300)
+
+        # Page controls of the results view
+        self.prev_btn = Button(self.root, text="<", width=3, bd=0, command=self.previous_page)
+        self.prev_btn.place(x=1170, y=350)
+        self.page_label = Label(self.root, text="", font=("Poppins", 11), bg="#EBE6E0")
+        self.page_label.place(x=1210, y=352, width=100)
+        self.next_btn = Button(self.root, text=">", width=3, bd=0, command=self.next_page)
+        self.next_btn.place(x=1310, y=350)
 
         # Text Widget to Display Results
         self.result_text = Text(
@@ -59,6 +104,7 @@ class Frontend:
 
     def upload_folder(self):
         """Open file dialog to select a folder."""
+        from tkinter import filedialog
         folder_path = filedialog.askdirectory()  # Open a dialog to select a folder
         if folder_path:
             self.file_path = folder_path  # Save the selected folder path
@@ -71,31 +117,204 @@ class Frontend:
             self.result_text.insert(
             END, "No folder selected. Please select a folder to proceed.\n"
             )
-           
+
 
     def detect_smells(self):
-        """Detect code smells in the uploaded file."""
-        if self.file_path:
-            # Initialize the CodeSmellDetector with the selected file
-            detector = CodeSmellDetector(self.file_path)
-            smells = detector.scan_for_smells()
-            code_smell_count= detector.get_smells_count()
-            
-
-            # Display the results in the text widget
-            self.result_text.delete(1.0, END)  # Clear previous results
-            if smells :
-                self.result_text.insert(END, "Code smells detected:\n")
-                self.result_text.insert(END, f"\nTotal code smells detected: {code_smell_count}\n\n")
-                for smell in smells:
-                    self.result_text.insert(END, f"- {smell}\n")
-            else:
-                self.result_text.insert(END, "No code smells detected.\n")
-        else:
+        """Start detecting code smells in the uploaded folder without blocking the window."""
+        if not self.file_path:
             self.result_text.delete(1.0, END)
             self.result_text.insert(END, "Please upload a file first!\n")
+            return
+        if self.worker is not None:
+            return
+
+        # Initialize the CodeSmellDetector with the selected folder and the settings of its pyproject.toml, using every CPU
+        try:
+            self.detector = CodeSmellDetector.from_config(self.file_path, jobs=0)
+        except (OSError, ValueError) as e:
+            self.result_text.delete(1.0, END)
+            self.result_text.insert(END, f"Invalid configuration: {e}\n")
+            return
+        self.cancel_event = threading.Event()
+        self.results = queue.Queue()
+        self.smells = []
+        self.page = 0
+        self.result_text.delete(1.0, END)
+        self.progress["value"] = 0
+        self.status.config(text="Scanning...")
+        self.detect_btn.config(state=DISABLED)
+        self.upload_btn.config(state=DISABLED)
+        self.cancel_btn.config(state=NORMAL)
+        self.update_page_controls()
+
+        self.worker = threading.Thread(
+            target=self.run_scan, args=(self.detector, self.cancel_event, self.results), daemon=True
+        )
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_results)
+
+    def run_scan(self, detector, cancel_event, results):
+        """Runs on the worker thread; everything it finds goes through the results queue."""
+        smells = detector.iter_smells()
+        try:
+            for smell in smells:
+                if cancel_event.is_set():
+                    break
+                results.put(("smell", str(smell)))
+            results.put(("done", cancel_event.is_set()))
+        except Exception as e:
+            results.put(("error", str(e)))
+        finally:
+            # Stops the worker processes right away when the scan was cancelled
+            smells.close()
+
+    def cancel_scan(self):
+        self.cancel_event.set()
+        self.cancel_btn.config(state=DISABLED)
+        self.status.config(text="Cancelling...")
+
+    def poll_results(self):
+        """Move findings from the worker into the results view in batches, then reschedule itself."""
+        batch = []
+        finished = None
+        try:
+            while len(batch) < BATCH_SIZE:
+                kind, *payload = self.results.get_nowait()
+                if kind == "smell":
+                    batch.append(payload[0])
+                else:
+                    finished = (kind, payload[0])
+                    break
+        except queue.Empty:
+            pass
+
+        if batch:
+            self.append_smells(batch)
+
+        detector = self.detector
+        if detector.files_total:
+            self.progress["value"] = 100 * detector.files_done / detector.files_total
+        self.status.config(text=f"{detector.files_done}/{detector.files_total} files, {len(self.smells)} smells")
+
+        if finished is None:
+            self.root.after(POLL_INTERVAL_MS, self.poll_results)
+        else:
+            self.finish_scan(*finished)
+
+    def append_smells(self, batch):
+        first_new = len(self.smells)
+        self.smells.extend(batch)
+
+        # Only the part of the batch that lands on the page being viewed touches the widget
+        page_end = (self.page + 1) * PAGE_SIZE
+        if first_new < page_end:
+            visible = batch[:page_end - first_new]
+            self.result_text.insert(END, "".join(f"- {smell}\n" for smell in visible))
+        self.update_page_controls()
+
+    def finish_scan(self, kind, detail):
+        self.worker = None
+        self.detect_btn.config(state=NORMAL)
+        self.upload_btn.config(state=NORMAL)
+        self.cancel_btn.config(state=DISABLED)
+
+        if kind == "error":
+            self.status.config(text="Scan failed")
+            self.result_text.insert(END, f"Error while scanning: {detail}\n")
+        elif detail:
+            self.status.config(text=f"Cancelled, {len(self.smells)} smells so far")
+        elif self.smells:
+            self.progress["value"] = 100
+            self.status.config(text=f"Total code smells detected: {len(self.smells)}")
+        else:
+            self.progress["value"] = 100
+            self.status.config(text="Done")
+            self.result_text.insert(END, "No code smells detected.\n")
+
+    def subscribe_to_watch(self, address):
+        """Show the live findings of a running `code_smells_detection.py --watch-socket ADDRESS` session."""
+        self.watch_files = {}
+        self.watch_classes = []
+        self.watch_clones = []
+        self.results = queue.Queue()
+        self.detect_btn.config(state=DISABLED)
+        self.upload_btn.config(state=DISABLED)
+        self.status.config(text=f"Connecting to {address}...")
+
+        self.worker = threading.Thread(target=self.run_subscription, args=(address, self.results), daemon=True)
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_watch)
+
+    def run_subscription(self, address, results):
+        """Runs on the worker thread, forwarding watch events to the GUI."""
+        # Only following a watch session needs the socket code
+        from watch import subscribe
+        try:
+            for event in subscribe(address):
+                results.put(event)
+            results.put({"type": "error", "message": "watch session ended"})
+        except OSError as e:
+            results.put({"type": "error", "message": str(e)})
+
+    def poll_watch(self):
+        refresh = False
+        try:
+            while True:
+                event = self.results.get_nowait()
+                if event["type"] == "file":
+                    if event["deleted"]:
+                        self.watch_files.pop(event["path"], None)
+                    else:
+                        self.watch_files[event["path"]] = [finding["message"] for finding in event["findings"]]
+                elif event["type"] == "hierarchy":
+                    self.watch_classes = [finding["message"] for finding in event["findings"]]
+                elif event["type"] == "clones":
+                    self.watch_clones = [finding["message"] for finding in event["findings"]]
+                elif event["type"] == "summary":
+                    # A summary closes every batch of changes, so the view is rebuilt once per batch
+                    refresh = True
+                    self.status.config(text=f"Watching: {event['smells']} smells in {event['files']} files")
+                else:
+                    self.status.config(text=f"Watch stopped: {event['message']}")
+                    return
+        except queue.Empty:
+            pass
+
+        if refresh:
+            self.smells = [smell for smells in self.watch_files.values() for smell in smells] + self.watch_classes + self.watch_clones
+            self.show_page(min(self.page, self.page_count() - 1))
+        self.root.after(POLL_INTERVAL_MS, self.poll_watch)
+
+    def page_count(self):
+        return max(1, (len(self.smells) + PAGE_SIZE - 1) // PAGE_SIZE)
+
+    def update_page_controls(self):
+        self.page_label.config(text=f"Page {self.page + 1}/{self.page_count()}")
+        self.prev_btn.config(state=NORMAL if self.page > 0 else DISABLED)
+        self.next_btn.config(state=NORMAL if self.page + 1 < self.page_count() else DISABLED)
+
+    def show_page(self, page):
+        self.page = page
+        start = page * PAGE_SIZE
+        self.result_text.delete(1.0, END)
+        self.result_text.insert(END, "".join(f"- {smell}\n" for smell in self.smells[start:start + PAGE_SIZE]))
+        self.update_page_controls()
+
+    def previous_page(self):
+        if self.page > 0:
+            self.show_page(self.page - 1)
+
+    def next_page(self):
+        if self.page + 1 < self.page_count():
+            self.show_page(self.page + 1)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python Code Smells Detection Software")
+    parser.add_argument("--watch", metavar="ADDRESS", help="follow a running watch session on HOST:PORT or a Unix socket")
+    args = parser.parse_args()
+
     root = Tk()
     obj = Frontend(root)
-    root.mainloop()
\ No newline at end of file
+    if args.watch:
+        obj.subscribe_to_watch(args.watch)
+    root.mainloop()
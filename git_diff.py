@@ -0,0 +1,110 @@
+import codecs
+import os
+import re
+import subprocess
+import sys
+from bisect import bisect_left
+
+# The new-file side of a hunk header: "@@ -12,3 +14,5 @@"; a missing count means 1
+HUNK_HEADER = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+# Every line of an untracked or newly added file is new
+WHOLE_FILE = [(1, sys.maxsize)]
+
+
+def git(directory, *args):
+    try:
+        return subprocess.run(['git', '-C', directory, *args], capture_output=True, check=True).stdout
+    except OSError as e:
+        raise ValueError(f"cannot run git: {e}") from None
+    except subprocess.CalledProcessError as e:
+        raise ValueError(e.stderr.decode('utf-8', 'replace').strip() or f"git {args[0]} failed") from None
+
+
+def changed_lines(directory, base_ref):
+    """Map the real path of every file changed since base_ref to its changed (first, last) line ranges.
+
+    Changes are taken from the merge base of base_ref and HEAD to the work tree, so a branch is compared
+    with the point it forked from and uncommitted edits count too. Added and untracked files are changed throughout.
+    Deleted files are left out. Raises ValueError when git fails, e.g. for an unknown ref.
+    """
+    top = os.fsdecode(git(directory, 'rev-parse', '--show-toplevel')).strip()
+    try:
+        base = os.fsdecode(git(top, 'merge-base', base_ref, 'HEAD')).strip()
+    except ValueError:
+        # No common history, or base_ref is not a commit that git can find a merge base for
+        base = base_ref
+
+    output = git(top, '-c', 'core.quotePath=false', 'diff', '--unified=0', '--no-color', '--no-ext-diff',
+                 '--find-renames', '--src-prefix=a/', '--dst-prefix=b/', base, '--')
+    changes = parse_diff(output.decode('utf-8', 'surrogateescape'), top)
+
+    for rel_path in git(top, 'ls-files', '-z', '--others', '--exclude-standard').split(b'\0'):
+        if rel_path:
+            changes[os.path.join(top, *os.fsdecode(rel_path).split('/'))] = WHOLE_FILE
+    return changes
+
+
+def parse_diff(text, top):
+    """Changed line ranges of the new side of a unified diff made with --unified=0, by absolute path; added files are WHOLE_FILE."""
+    changes = {}
+    new_paths = set()
+    ranges = None
+    in_header = False
+    new_file = False
+    for line in text.splitlines():
+        if line.startswith('diff --git '):
+            in_header = True
+            new_file = False
+            ranges = None
+        elif in_header and line.startswith('new file mode'):
+            new_file = True
+        elif in_header and line.startswith('+++ '):
+            # git ends a name that has spaces with a tab
+            path = unquote(line[4:].split('\t')[0])
+            if path == '/dev/null':
+                ranges = None
+                continue
+            path = os.path.join(top, *path[2:].split('/'))
+            ranges = changes.setdefault(path, [])
+            if new_file:
+                new_paths.add(path)
+        elif line.startswith('@@'):
+            in_header = False
+            match = HUNK_HEADER.match(line)
+            if ranges is None or match is None:
+                continue
+            start = int(match.group(1))
+            count = 1 if match.group(2) is None else int(match.group(2))
+            if count:
+                ranges.append((start, start + count - 1))
+            else:
+                # Lines were only removed, after line start; the code around them still changed
+                ranges.append((max(start, 1), max(start, 1)))
+    return {path: WHOLE_FILE if path in new_paths else merge_ranges(ranges) for path, ranges in changes.items() if ranges}
+
+
+def unquote(path):
+    # Paths with unusual characters come C-quoted, as "a/caf\303\251.py"
+    if path.startswith('"') and path.endswith('"'):
+        return codecs.escape_decode(path[1:-1].encode('utf-8'))[0].decode('utf-8', 'surrogateescape')
+    return path
+
+
+def merge_ranges(ranges):
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def overlaps(ranges, first, last):
+    """Whether any of the sorted, merged ranges shares a line with first..last."""
+    index = bisect_left(ranges, (first, first))
+    # The range starting before first may still reach into it
+    if index and ranges[index - 1][1] >= first:
+        return True
+    return index < len(ranges) and ranges[index][0] <= last
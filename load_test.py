@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from watch import parse_address
+
+# Sent when no --files are given: a small module with a few findings, like an editor buffer
+SAMPLE_SOURCE = '''import os
+
+
+def loadConfig(path, mode, encoding, retries, timeout, verbose):
+    for attempt in range(retries):
+        try:
+            with open(path, mode, encoding=encoding) as file:
+                return file.read()
+        except:
+            pass
+    return os.environ.get("DEFAULT_CONFIG", "")
+'''
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection to the service."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, address):
+        family, target = parse_address(address)
+        if family == socket.AF_UNIX:
+            return cls(*await asyncio.open_unix_connection(target))
+        return cls(*await asyncio.open_connection(*target))
+
+    async def request(self, method, path, payload=None):
+        """Send a request and return (status, body), reading a chunked NDJSON body to its end."""
+        body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            return status, b''.join(chunks)
+        return status, await self.reader.readexactly(int(headers.get('content-length', 0)))
+
+    def close(self):
+        self.writer.close()
+
+
+def load_sources(paths):
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                sources.extend(os.path.join(root, name) for name in files if name.endswith('.py'))
+        else:
+            sources.append(path)
+    contents = []
+    for path in sorted(sources):
+        with open(path, encoding='utf-8', errors='ignore') as file:
+            contents.append((os.path.relpath(path), file.read()))
+    return contents
+
+
+async def wait_until_up(address, seconds=30.0):
+    deadline = time.monotonic() + seconds
+    while True:
+        try:
+            connection = await Connection.open(address)
+            await connection.request('GET', '/health')
+            connection.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def load_test(address, sources, requests, concurrency, distinct):
+    """Send requests with concurrency clients; return the latency of each request and the count per status."""
+    latencies = []
+    statuses = {}
+    counter = iter(range(requests))
+
+    async def client():
+        connection = await Connection.open(address)
+        try:
+            for number in counter:
+                path, content = sources[number % len(sources)]
+                if distinct:
+                    # A different hash every time, so nothing is served from the result cache or coalesced
+                    content = f"{content}\n# request {number}\n"
+                start = time.perf_counter()
+                status, body = await connection.request('POST', '/analyze', {'path': path, 'content': content})
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(args):
+    sources = load_sources(args.files) if args.files else [('sample.py', SAMPLE_SOURCE)]
+    await wait_until_up(args.address)
+
+    start = time.perf_counter()
+    latencies, statuses = await load_test(args.address, sources, args.requests, args.concurrency, args.distinct)
+    seconds = time.perf_counter() - start
+
+    connection = await Connection.open(args.address)
+    status, body = await connection.request('GET', '/health')
+    connection.close()
+
+    ms = [latency * 1000 for latency in latencies]
+    print(f"{len(latencies)} requests from {args.concurrency} clients in {seconds:.2f}s: {len(latencies) / seconds:.0f} requests/s")
+    print(f"latency ms: p50 {statistics.median(ms):.2f}  p95 {percentile(ms, 0.95):.2f}  "
+          f"p99 {percentile(ms, 0.99):.2f}  max {max(ms):.2f}")
+    print(f"statuses: {dict(sorted(statuses.items()))}")
+    print(f"server: {json.loads(body)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput and latency of a running scan service.")
+    parser.add_argument("--address", default="127.0.0.1:8765", help="HOST:PORT or Unix socket path of the service (default: %(default)s)")
+    parser.add_argument("--files", nargs="*", help="send these files or directories instead of a built-in sample")
+    parser.add_argument("-n", "--requests", type=int, default=1000, help="number of requests (default: %(default)s)")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="concurrent clients (default: %(default)s)")
+    parser.add_argument("--distinct", action="store_true", help="make every request's content unique, defeating the result cache")
+    parser.add_argument("--spawn", action="store_true", help="start a service on --address for the test and stop it afterwards")
+    parser.add_argument("-j", "--jobs", type=int, default=0, help="workers of a spawned service, 0 for one per CPU (default: 0)")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'code_smells_detection', '--serve', args.address, '--jobs', str(args.jobs), '--no-cache'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL,
+        )
+    try:
+        asyncio.run(run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
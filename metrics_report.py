@@ -0,0 +1,168 @@
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import compress, repeat
+from operator import add, mul
+
+# The metrics of one file as a worker sends them back: its line count, and per function
+# (name, line, LOC, CC, ATFD, LAA) and per class (name, line, LOC, WMC, ATFD, TCC, NOA+NOM)
+class FileMetrics(namedtuple('FileMetrics', 'loc functions classes')):
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        # Rebuild from the JSON form the result cache stores
+        loc, functions, classes = row
+        return cls(loc, tuple(map(tuple, functions)), tuple(map(tuple, classes)))
+
+
+# Columns of each level, in the order FileMetrics gives them after name and line
+FUNCTION_METRICS = ('loc', 'cc', 'atfd', 'laa')
+CLASS_METRICS = ('loc', 'wmc', 'atfd', 'tcc', 'noa_nom')
+FILE_METRICS = ('loc', 'cc', 'functions', 'classes', 'findings')
+
+# Weight of each metric in the hotspot score. Metrics enter as percentile ranks, so metrics of
+# different scales add up; LAA and TCC are left out since a low value is only bad next to high coupling
+HOTSPOT_WEIGHTS = {
+    'file': {'cc': 0.4, 'findings': 0.4, 'loc': 0.2},
+    'class': {'wmc': 0.4, 'atfd': 0.3, 'noa_nom': 0.2, 'loc': 0.1},
+    'function': {'cc': 0.5, 'loc': 0.3, 'atfd': 0.2},
+}
+
+REPORT_PERCENTILES = (0.5, 0.9, 0.99)
+
+# Rows further than this many standard deviations from the mean are outliers
+OUTLIER_Z = 3.0
+
+
+class MetricTable:
+    """Metrics of one level (files, classes or functions) as one array of floats per metric.
+
+    Every statistic works on whole columns with sorted(), map() and bisect, so the per-row work
+    runs in C and a million functions summarize in seconds.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.columns = {metric: array('d') for metric in metrics}
+        self.paths = []
+        self.names = []
+        self.lines = array('l')
+
+    def __len__(self):
+        return len(self.lines)
+
+    def add(self, path, name, line, values):
+        self.paths.append(path)
+        self.names.append(name)
+        self.lines.append(line)
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+
+    def where(self, index):
+        # Files are rows of their own, without a line or name
+        if not self.lines[index]:
+            return self.paths[index]
+        return f"{self.paths[index]}:{self.lines[index]} {self.names[index]}"
+
+    def percentiles(self, metric, fractions=REPORT_PERCENTILES):
+        """Linearly interpolated percentiles of a metric, one per fraction."""
+        ordered = sorted(self.columns[metric])
+        if not ordered:
+            return [0.0 for fraction in fractions]
+        values = []
+        for fraction in fractions:
+            position = fraction * (len(ordered) - 1)
+            low = int(position)
+            high = min(low + 1, len(ordered) - 1)
+            values.append(ordered[low] + (ordered[high] - ordered[low]) * (position - low))
+        return values
+
+    def zscores(self, metric):
+        """(mean, standard deviation, z-score of every row) of a metric; all z-scores are 0 when it is constant."""
+        column = self.columns[metric]
+        if not column:
+            return 0.0, 0.0, array('d')
+        mean = math.fsum(column) / len(column)
+        centered = array('d', map(add, column, repeat(-mean)))
+        deviation = math.sqrt(math.fsum(map(mul, centered, centered)) / len(column))
+        if not deviation:
+            return mean, 0.0, array('d', bytes(8 * len(column)))
+        return mean, deviation, array('d', map(mul, centered, repeat(1 / deviation)))
+
+    def outliers(self, metric, threshold=OUTLIER_Z):
+        """Indexes of the rows whose metric is more than threshold standard deviations from the mean, largest first."""
+        mean, deviation, scores = self.zscores(metric)
+        return outlier_indexes(scores, threshold)
+
+    def percentile_ranks(self, metric):
+        # Fraction of rows with a smaller value; equal values share a rank
+        column = self.columns[metric]
+        ordered = sorted(column)
+        scale = 1 / max(len(column) - 1, 1)
+        return map(mul, map(bisect_left, repeat(ordered), column), repeat(scale))
+
+    def hotspot_scores(self, weights):
+        """Weighted sum of the percentile ranks of the weighted metrics, between 0 and the sum of the weights."""
+        scores = array('d', bytes(8 * len(self)))
+        for metric, weight in weights.items():
+            scores = array('d', map(add, scores, map(mul, self.percentile_ranks(metric), repeat(weight))))
+        return scores
+
+    def hotspots(self, weights, top=10):
+        """(score, index) of the top rows by hotspot score, highest first."""
+        scores = self.hotspot_scores(weights)
+        return [(scores[index], index) for index in heapq.nlargest(top, range(len(scores)), key=scores.__getitem__)]
+
+
+def outlier_indexes(scores, threshold=OUTLIER_Z):
+    indexes = list(compress(range(len(scores)), map(threshold.__lt__, map(abs, scores))))
+    indexes.sort(key=scores.__getitem__, reverse=True)
+    return indexes
+
+
+class RepoMetrics:
+    """Per-file, per-class and per-function metrics of a whole scan, collected as the files come in."""
+
+    def __init__(self):
+        self.files = MetricTable(FILE_METRICS)
+        self.classes = MetricTable(CLASS_METRICS)
+        self.functions = MetricTable(FUNCTION_METRICS)
+
+    def add(self, path, metrics, findings):
+        """Add the FileMetrics of one file, which had findings findings."""
+        complexity = math.fsum(function[3] for function in metrics.functions)
+        self.files.add(path, '', 0, (metrics.loc, complexity, len(metrics.functions), len(metrics.classes), findings))
+        for name, line, *values in metrics.classes:
+            self.classes.add(path, name, line, values)
+        for name, line, *values in metrics.functions:
+            self.functions.add(path, name, line, values)
+
+    def tables(self):
+        return (('file', self.files), ('class', self.classes), ('function', self.functions))
+
+    def report(self, top=10, threshold=OUTLIER_Z, weights=HOTSPOT_WEIGHTS):
+        lines = [f"\nMetrics of {len(self.files)} files, {len(self.classes)} classes and {len(self.functions)} functions:"]
+        header = ' '.join(f"{'p%g' % (fraction * 100):>9}" for fraction in REPORT_PERCENTILES)
+        for level, table in self.tables():
+            if not len(table):
+                continue
+            lines.append(f"  {'Per ' + level:13}{'mean':>9} {'stdev':>9} {header} {'max':>9}  outliers (|z| > {threshold:g})")
+            for metric in table.metrics:
+                mean, deviation, scores = table.zscores(metric)
+                outliers = outlier_indexes(scores, threshold)
+                values = ' '.join(f"{value:9.2f}" for value in table.percentiles(metric, REPORT_PERCENTILES + (1.0,)))
+                worst = f", most extreme {table.where(outliers[0])}" if outliers else ''
+                lines.append(f"    {metric:10} {mean:9.2f} {deviation:9.2f} {values}  {len(outliers)}{worst}")
+
+        for level, table in self.tables():
+            if not len(table):
+                continue
+            formula = ' + '.join(f"{weight:g}*{metric}" for metric, weight in weights[level].items())
+            lines.append(f"  Top {level} hotspots, by percentile rank of {formula}:")
+            for score, index in table.hotspots(weights[level], top):
+                values = ', '.join(f"{metric} {table.columns[metric][index]:g}" for metric in table.metrics)
+                lines.append(f"    {score:6.3f}  {table.where(index)}  ({values})")
+        return "\n".join(lines)
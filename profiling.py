@@ -0,0 +1,147 @@
+import heapq
+import os
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+
+NULL_CONTEXT = nullcontext()
+
+
+class NullTimer:
+    """Stands in for RuleTimer when profiling is off, so the analysis code needs no branches."""
+
+    def measure(self, rule):
+        return NULL_CONTEXT
+
+
+NULL_TIMER = NullTimer()
+
+
+class RuleTimer:
+    """Wall time and call counts per rule for one file. It is sent back from worker processes as is."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.total = 0.0
+
+    def add(self, rule, seconds, calls=1):
+        self.seconds[rule] = self.seconds.get(rule, 0.0) + seconds
+        self.calls[rule] = self.calls.get(rule, 0) + calls
+
+    @contextmanager
+    def measure(self, rule):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(rule, perf_counter() - start)
+
+    def wrap(self, rule, handler):
+        # Only used when profiling, so disabled scans keep calling the bare handlers
+        seconds = self.seconds
+        calls = self.calls
+
+        def timed(*args):
+            start = perf_counter()
+            handler(*args)
+            seconds[rule] = seconds.get(rule, 0.0) + perf_counter() - start
+            calls[rule] = calls.get(rule, 0) + 1
+
+        return timed
+
+
+class Profiler:
+    """Collects the per-file RuleTimers of a scan and passes them on to any attached hooks.
+
+    A hook is any object with an on_file(path, timer) and/or on_scan_end(profiler) method.
+    """
+
+    def __init__(self, top=10):
+        self.top = top
+        self.seconds = {}
+        self.calls = {}
+        self.files = 0
+        self.file_seconds = []
+        self.hooks = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def add_timer(self, timer):
+        for rule, seconds in timer.seconds.items():
+            self.seconds[rule] = self.seconds.get(rule, 0.0) + seconds
+            self.calls[rule] = self.calls.get(rule, 0) + timer.calls[rule]
+
+    def add_file(self, path, timer):
+        self.files += 1
+        self.add_timer(timer)
+
+        # Only the slowest files are kept
+        if len(self.file_seconds) < self.top:
+            heapq.heappush(self.file_seconds, (timer.total, path))
+        elif timer.total > self.file_seconds[0][0]:
+            heapq.heapreplace(self.file_seconds, (timer.total, path))
+
+        for hook in self.hooks:
+            if hasattr(hook, 'on_file'):
+                hook.on_file(path, timer)
+
+    def finish(self):
+        for hook in self.hooks:
+            if hasattr(hook, 'on_scan_end'):
+                hook.on_scan_end(self)
+
+    def slowest_files(self):
+        return sorted(self.file_seconds, reverse=True)
+
+    def report(self):
+        lines = [f"\nProfile of {self.files} analyzed files (cached files are not included):", "  Rule time:"]
+        for rule, seconds in sorted(self.seconds.items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"    {rule:45} {seconds:9.3f}s {self.calls[rule]:10} calls")
+        lines.append(f"  Slowest {len(self.file_seconds)} files:")
+        for seconds, path in self.slowest_files():
+            lines.append(f"    {seconds:9.3f}s  {path}")
+        return "\n".join(lines)
+
+
+class PrometheusTextfileExporter:
+    """Hook that writes scan metrics in the Prometheus text format, for the node_exporter textfile collector."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def on_scan_end(self, profiler):
+        lines = [
+            "# HELP code_smells_rule_seconds_total Wall time spent in each rule.",
+            "# TYPE code_smells_rule_seconds_total counter",
+        ]
+        lines.extend(f'code_smells_rule_seconds_total{{rule="{rule}"}} {seconds}' for rule, seconds in sorted(profiler.seconds.items()))
+        lines.append("# HELP code_smells_rule_calls_total Calls of each rule.")
+        lines.append("# TYPE code_smells_rule_calls_total counter")
+        lines.extend(f'code_smells_rule_calls_total{{rule="{rule}"}} {calls}' for rule, calls in sorted(profiler.calls.items()))
+        lines.append("# HELP code_smells_files_analyzed Files analyzed by the last scan.")
+        lines.append("# TYPE code_smells_files_analyzed gauge")
+        lines.append(f"code_smells_files_analyzed {profiler.files}")
+
+        # Write then rename, so the collector never reads a half-written file
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary, self.path)
+
+
+@contextmanager
+def cprofile_to(path):
+    """Run the enclosed code under cProfile and dump the pstats data to path; does nothing when path is None."""
+    if path is None:
+        yield
+        return
+
+    import cProfile
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,128 @@
+import ast
+import tokenize
+from collections import namedtuple
+
+# One reportable rule: its finding id, the group of checks that produces it, the AST node or token
+# types it consumes and its default thresholds. Rules of one group share a pass, such as the
+# 'functions' handler of the tree walk; groups outside the walk and the tokenize pass consume nothing.
+Rule = namedtuple('Rule', 'id group consumes thresholds')
+
+RULES = {rule.id: rule for rule in (
+    Rule('TOO_MANY_ARGUMENTS', 'functions', (ast.FunctionDef,), {'args': 5}),
+    Rule('LONG_METHOD', 'functions', (ast.FunctionDef,), {'statements': 100}),
+    Rule('NESTED_LOOPS', 'functions', (ast.FunctionDef,), {'loops': 3}),
+    Rule('LARGE_CLASS', 'classes', (ast.ClassDef,), {'loc': 200, 'noa_nom': 40}),
+    Rule('LONG_BASE_LIST', 'classes', (ast.ClassDef,), {'bases': 3}),
+    Rule('HIGH_COMPLEXITY', 'complexity', (), {'complexity': 8}),
+    Rule('MAGIC_NUMBER', 'magic_numbers', (tokenize.NUMBER,), {}),
+    Rule('EXCESSIVE_COMMENTS', 'excessive_comments', (tokenize.COMMENT,), {'comments': 20}),
+    Rule('TOO_MANY_IMPORTS', 'unnecessary_imports', (tokenize.NAME,), {'imports': 15}),
+    Rule('LONG_LINE', 'long_lines', (), {'length': 80}),
+    Rule('UNREACHABLE_CODE', 'unreachable_code', (ast.FunctionDef,), {}),
+    Rule('FUNCTION_NAME', 'naming_conventions', (ast.FunctionDef,), {}),
+    Rule('VARIABLE_NAME', 'naming_conventions', (ast.Name,), {}),
+    Rule('USELESS_EXCEPTION', 'useless_exception_handling', (ast.Try,), {}),
+    Rule('COMPLEX_LIST_COMPREHENSION', 'list_comprehension_complexity', (ast.ListComp,), {'loops_and_conditions': 4}),
+    Rule('FUNCTIONAL_DECOMPOSITION', 'functional_decomposition', (ast.FunctionDef,), {'statements': 151}),
+    Rule('SPAGHETTI_CODE', 'spaghetti_code', (ast.ClassDef,), {'private_fields': 7, 'methods': 16}),
+    Rule('FEATURE_ENVY', 'feature_envy', (ast.FunctionDef,), {'fdp': 5, 'atfd': 5, 'laa': 1/3}),
+    Rule('GOD_CLASS', 'god_class', (ast.ClassDef,), {'wmc': 47, 'atfd': 5, 'tcc': 1/3}),
+    Rule('DEEP_INHERITANCE', 'class_hierarchy', (), {'dit': 5}),
+    Rule('HIGH_COUPLING', 'class_hierarchy', (), {'efferent': 14}),
+    Rule('DUPLICATE_CODE', 'clones', (), {}),
+)}
+
+# Codes other linters use for the same rules
+ALIASES = {
+    'C901': 'HIGH_COMPLEXITY',
+    'E501': 'LONG_LINE',
+}
+
+
+def rule_id(name):
+    rule = ALIASES.get(name.upper(), name.upper())
+    if rule not in RULES:
+        raise ValueError(f"unknown rule {name}")
+    return rule
+
+
+def split_rules(value):
+    # "C901,LONG_LINE" on the command line, a list in TOML
+    if isinstance(value, str):
+        value = value.split(',')
+    return [name.strip() for name in value if name.strip()]
+
+
+def load_profile(path):
+    """Read the rule settings of a TOML file: the [tool.code-smells] table of a pyproject.toml, or a whole profile."""
+    try:
+        import tomllib
+    except ImportError:
+        raise ValueError("reading a TOML profile needs Python 3.11 or later") from None
+    with open(path, 'rb') as file:
+        document = tomllib.load(file)
+    return document.get('tool', {}).get('code-smells', document)
+
+
+class RuleSet:
+    """The rules a scan runs and their thresholds, resolved once before the scan starts.
+
+    Only enabled rules have an entry in thresholds, so checks find out whether they run with one
+    dict lookup; groups lists the passes at least one enabled rule needs.
+    """
+
+    def __init__(self, select=None, ignore=(), thresholds=None):
+        enabled = list(RULES) if select is None else [rule_id(name) for name in split_rules(select)]
+        ignored = {rule_id(name) for name in split_rules(ignore)}
+        self.enabled = tuple(rule for rule in RULES if rule in enabled and rule not in ignored)
+
+        overrides = {rule_id(name): values for name, values in (thresholds or {}).items()}
+        self.thresholds = {}
+        for rule in self.enabled:
+            values = dict(RULES[rule].thresholds)
+            for name, value in overrides.get(rule, {}).items():
+                if name not in values:
+                    raise ValueError(f"unknown threshold {name} of rule {rule}")
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"threshold {name} of rule {rule} must be a number")
+                values[name] = value
+            self.thresholds[rule] = values
+
+        self.groups = frozenset(RULES[rule].group for rule in self.enabled)
+        self.signature = ';'.join(f"{rule}{sorted(self.thresholds[rule].items())}" for rule in self.enabled)
+
+    @classmethod
+    def from_config(cls, config, select=None, ignore=None):
+        """Build the rule set of a [tool.code-smells] table; select and ignore, when given, replace the table's."""
+        return cls(
+            select if select is not None else config.get('select'),
+            ignore if ignore is not None else config.get('ignore', ()),
+            config.get('thresholds'),
+        )
+
+    def uses(self, group):
+        return group in self.groups
+
+    def consumes(self, group):
+        """Node or token types the enabled rules of group consume."""
+        types = []
+        for rule in self.enabled:
+            if RULES[rule].group == group:
+                for node_type in RULES[rule].consumes:
+                    if node_type not in types:
+                        types.append(node_type)
+        return tuple(types)
+
+    def key(self):
+        # Everything about the rules that changes what a scan reports, for the result cache
+        return self.signature
+
+    # Copies sent to worker processes are equal, so they share the dispatch tables compiled for them
+    def __eq__(self, other):
+        return isinstance(other, RuleSet) and self.signature == other.signature
+
+    def __hash__(self):
+        return hash(self.signature)
+
+
+ALL_RULES = RuleSet()
@@ -0,0 +1,358 @@
+import asyncio
+import hashlib
+import json
+import os
+import signal
+import socket
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from watch import parse_address
+
+# Files submitted to the pool but not analyzed yet; requests that would queue more are turned away with 503
+DEFAULT_MAX_PENDING = 64
+
+# Results kept by content hash, so editors re-sending an unchanged buffer get an answer without the pool
+RESULT_CACHE_SIZE = 1024
+
+# Largest request body accepted, and the most header lines in a request
+MAX_BODY_BYTES = 64 * 1024 * 1024
+MAX_HEADERS = 100
+
+# Analyzed once by every worker at startup, so the first real request does not pay for imports
+WARMUP_SOURCE = b"def warm_up(value):\n    if value:\n        return value\n    return None\n"
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    503: 'Service Unavailable',
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Overloaded(Exception):
+    """More work than the pending limit allows."""
+
+
+# The detector of a worker process, set by the pool initializer
+worker_detector = None
+
+
+def init_worker(detector):
+    global worker_detector
+    worker_detector = detector
+
+
+def analyze_in_worker(path, data):
+    # Only the findings go back; clones and class hierarchies span files and are not served
+    return worker_detector.analyze(path, data).findings
+
+
+class ScanService:
+    """Analyzes single files for local clients on a warm process pool.
+
+    Concurrent requests for the same content share one analysis, and finished results are kept by
+    content hash. Work that would push the pool's queue over max_pending is refused instead of
+    queued, so a burst of requests degrades into quick 503s rather than ever slower answers.
+    """
+
+    def __init__(self, detector, workers=None, max_pending=DEFAULT_MAX_PENDING, cache_size=RESULT_CACHE_SIZE):
+        self.detector = detector
+        self.workers = workers or detector.jobs
+        self.max_pending = max_pending
+        self.cache_size = cache_size
+        self.pool = None
+        # Content hash -> future of the analysis in progress, and -> its findings once done, least recently used first
+        self.in_flight = {}
+        self.results = OrderedDict()
+        self.pending = 0
+        self.stats = {'requests': 0, 'files': 0, 'analyzed': 0, 'coalesced': 0, 'cached': 0, 'rejected': 0}
+
+    async def start(self):
+        self.pool = ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=(self.detector,))
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.pool, analyze_in_worker, '<warm-up>', WARMUP_SOURCE) for _ in range(self.workers)
+        ))
+
+    def close(self):
+        if self.pool is not None:
+            if sys.version_info >= (3, 9):
+                self.pool.shutdown(cancel_futures=True)
+            else:
+                # Queued work can only be cancelled from Python 3.9 on; here it runs to the end first
+                self.pool.shutdown()
+            self.pool = None
+
+    def admit(self, digests):
+        """Raise Overloaded when analyzing the digests that are neither cached nor in flight would queue too much."""
+        new = {digest for digest in digests if digest not in self.results and digest not in self.in_flight}
+        if self.pending + len(new) > self.max_pending:
+            self.stats['rejected'] += 1
+            raise Overloaded()
+
+    async def analyze(self, path, data, digest):
+        """Return (findings, how) for one file, where how is 'analyzed', 'coalesced' or 'cached'."""
+        cached = self.results.get(digest)
+        if cached is not None:
+            self.results.move_to_end(digest)
+            self.stats['cached'] += 1
+            return rebase(cached, path), 'cached'
+
+        future = self.in_flight.get(digest)
+        if future is not None:
+            self.stats['coalesced'] += 1
+            # shield: a client that hangs up must not cancel the analysis other clients wait for
+            return rebase(await asyncio.shield(future), path), 'coalesced'
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.pool, analyze_in_worker, path, data)
+        self.in_flight[digest] = future
+        self.pending += 1
+        future.add_done_callback(lambda done: self.finish(digest, done))
+        self.stats['analyzed'] += 1
+        return rebase(await asyncio.shield(future), path), 'analyzed'
+
+    def finish(self, digest, future):
+        self.pending -= 1
+        del self.in_flight[digest]
+        if not future.cancelled() and future.exception() is None:
+            self.results[digest] = future.result()
+            while len(self.results) > self.cache_size:
+                self.results.popitem(last=False)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    await send_json(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self.respond(writer, method, target, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, method, target, body, keep_alive):
+        self.stats['requests'] += 1
+        path = target.partition('?')[0]
+        if path == '/health':
+            await send_json(writer, 200, self.health(), keep_alive)
+        elif path != '/analyze':
+            await send_json(writer, 404, {'error': f"no endpoint {path}"}, keep_alive)
+        elif method != 'POST':
+            await send_json(writer, 405, {'error': "use POST"}, keep_alive)
+        else:
+            try:
+                files = await self.load_files(body)
+                digests = [hashlib.blake2b(data, digest_size=20).digest() for path, data in files]
+                self.admit(digests)
+            except HttpError as e:
+                await send_json(writer, e.status, {'error': str(e)}, keep_alive)
+                return
+            except Overloaded:
+                await send_json(writer, 503, {'error': "too much queued work, retry later"}, keep_alive, retry_after=1)
+                return
+            await self.stream_findings(writer, files, digests, keep_alive)
+
+    async def load_files(self, body):
+        """The (path, source) pairs of an /analyze body: {"path", "content"} or {"files": [...]} of those.
+        Files sent without content are read from disk, relative to the scanned directory."""
+        try:
+            request = json.loads(body)
+        except ValueError as e:
+            raise HttpError(400, f"invalid JSON: {e}") from None
+        entries = request.get('files', [request]) if isinstance(request, dict) else None
+        if not entries or not all(isinstance(entry, dict) and isinstance(entry.get('path'), str) for entry in entries):
+            raise HttpError(400, 'expected {"path": ..., "content": ...} or {"files": [...]}')
+
+        loop = asyncio.get_running_loop()
+        files = []
+        for entry in entries:
+            content = entry.get('content')
+            if content is None:
+                file_path = self.scanned_path(entry['path'])
+                if not await loop.run_in_executor(None, self.detector.file_finder.matches, file_path):
+                    raise HttpError(404, f"{entry['path']} is not a file the scan includes")
+                try:
+                    data = await loop.run_in_executor(None, read_file, file_path)
+                except OSError as e:
+                    raise HttpError(404, f"cannot read {entry['path']}: {e.strerror}") from None
+            else:
+                data = str(content).encode('utf-8', 'surrogatepass')
+            files.append((entry['path'], data))
+        return files
+
+    def scanned_path(self, path):
+        """The path of a requested file below the scanned directory; anything that resolves outside it is refused."""
+        root = os.path.realpath(self.detector.directory)
+        # realpath resolves '..' and symlinks, so neither can lead out of the root
+        real_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, real_path]) != root:
+            raise HttpError(400, f"{path} is outside the scanned directory")
+        # Relative to the directory as the FileFinder knows it, so its include, exclude and ignore rules apply
+        return os.path.join(self.detector.directory, os.path.relpath(real_path, root))
+
+    async def stream_findings(self, writer, files, digests, keep_alive):
+        # Findings go out as NDJSON, a file at a time in the order the files finish
+        start = time.perf_counter()
+        send_head(writer, 200, 'application/x-ndjson', keep_alive, chunked=True)
+        tasks = [asyncio.ensure_future(self.analyze_entry(path, data, digest)) for (path, data), digest in zip(files, digests)]
+        smells = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                path, findings, how = await next_done
+                if findings is None:
+                    await send_chunk(writer, [{'type': 'error', 'path': path, 'error': how}])
+                    continue
+                self.stats['files'] += 1
+                smells += len(findings)
+                lines = [dict(finding.to_json(), type='finding') for finding in findings]
+                lines.append({'type': 'file', 'path': path, 'smells': len(findings), 'result': how})
+                await send_chunk(writer, lines)
+            await send_chunk(writer, [{'type': 'done', 'files': len(files), 'smells': smells,
+                                       'ms': round((time.perf_counter() - start) * 1000, 3)}])
+            await send_chunk(writer, None)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def analyze_entry(self, path, data, digest):
+        try:
+            findings, how = await self.analyze(path, data, digest)
+        except Exception as e:  # e.g. a worker that died
+            return path, None, str(e) or type(e).__name__
+        return path, findings, how
+
+    def health(self):
+        return dict(self.stats, status='ok', workers=self.workers, pending=self.pending, max_pending=self.max_pending,
+                    cached_results=len(self.results))
+
+
+def rebase(findings, path):
+    # Results are shared by content, so findings of another requester's path are moved to this one
+    return [finding if finding.path == path else finding._replace(path=path) for finding in findings]
+
+
+def read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request as (method, target, headers, body), or None at end of stream."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "malformed request line") from None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HttpError(400, "too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'transfer-encoding' in headers:
+        raise HttpError(411, "send a Content-Length instead of a chunked body")
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400, "invalid Content-Length") from None
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"bodies are limited to {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method, target, headers, body
+
+
+def send_head(writer, status, content_type, keep_alive, length=None, chunked=False, retry_after=None):
+    lines = [f"HTTP/1.1 {status} {REASONS[status]}", f"Content-Type: {content_type}"]
+    if chunked:
+        lines.append("Transfer-Encoding: chunked")
+    else:
+        lines.append(f"Content-Length: {length}")
+    if retry_after is not None:
+        lines.append(f"Retry-After: {retry_after}")
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+
+async def send_json(writer, status, payload, keep_alive, retry_after=None):
+    body = json.dumps(payload).encode('utf-8')
+    send_head(writer, status, 'application/json', keep_alive, len(body), retry_after=retry_after)
+    writer.write(body)
+    await writer.drain()
+
+
+async def send_chunk(writer, lines):
+    """Send NDJSON lines as one chunk, or end the body when lines is None."""
+    if lines is None:
+        writer.write(b'0\r\n\r\n')
+    else:
+        data = ''.join(json.dumps(line) + '\n' for line in lines).encode('utf-8')
+        writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+    # Waits while the client is slow to read, so a stalled client holds no more than a socket buffer
+    await writer.drain()
+
+
+async def start_server(service, address):
+    family, bind_address = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_address):
+            os.unlink(bind_address)
+        return await asyncio.start_unix_server(service.handle_connection, bind_address)
+    return await asyncio.start_server(service.handle_connection, *bind_address)
+
+
+async def run(detector, address, workers=None, max_pending=DEFAULT_MAX_PENDING, ready=None):
+    service = ScanService(detector, workers, max_pending)
+    # SIGTERM stops the service like Ctrl-C does, so the worker processes are shut down with it
+    if hasattr(signal, 'SIGTERM'):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        except NotImplementedError:
+            pass
+    await service.start()
+    try:
+        server = await start_server(service, address)
+        if ready is not None:
+            ready(service)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def serve(detector, address, workers=None, max_pending=DEFAULT_MAX_PENDING):
+    """Serve POST /analyze and GET /health on address, 'host:port' or a Unix socket path, until interrupted."""
+    def ready(service):
+        print(f"[serve] {service.workers} worker(s) ready, listening on {address}", flush=True)
+
+    try:
+        asyncio.run(run(detector, address, workers, max_pending, ready))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
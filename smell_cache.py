@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# Bump when the tables change; an older cache is then dropped instead of misread
+SCHEMA_VERSION = 4
+
+# Default upper bound for the stored findings before the least recently used ones are evicted
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def open_cache(cache_dir, config_key, max_bytes=DEFAULT_MAX_BYTES):
+    """Open the cache, or return None when it can't be used (e.g. a read-only checkout)."""
+    try:
+        return ResultCache(cache_dir, config_key, max_bytes)
+    except (OSError, sqlite3.Error):
+        return None
+
+
+class ResultCache:
+    """On-disk cache of per-file findings, keyed by file content, so unchanged files are never parsed again.
+
+    A file's content hash is remembered together with its mtime and size, so a file whose stat has not
+    changed is looked up without even being read.
+    """
+
+    def __init__(self, cache_dir, config_key, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.config_key = config_key
+        self.max_bytes = max_bytes
+        self.now = time.time_ns()
+        self.used_keys = []
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'results.sqlite3'))
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("DROP TABLE IF EXISTS results")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, digest TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, findings TEXT, fingerprints BLOB, classes TEXT, metrics TEXT, nbytes INTEGER, used INTEGER)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def key(self, file_path, config_key=None):
+        """Cache key of a file as it is now on disk, or None if it can't be read.
+
+        config_key, when given, stands in for the cache's own, so one cache can serve several configurations.
+        """
+        try:
+            digest = self.file_digest(file_path)
+        except OSError:
+            return None
+        if config_key is None:
+            config_key = self.config_key
+        return hashlib.sha256(f"{config_key}\0{file_path}\0{digest}".encode('utf-8')).hexdigest()
+
+    def contains(self, key):
+        return self.db.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is not None
+
+    def load(self, key):
+        """Return (findings, fingerprints, class summary, file metrics) stored under key, or None."""
+        row = self.db.execute("SELECT findings, fingerprints, classes, metrics FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        self.used_keys.append(key)
+        return json.loads(row[0]), row[1], json.loads(row[2]), json.loads(row[3])
+
+    def put(self, key, findings, fingerprints=b'', classes=None, metrics=None):
+        data = json.dumps(findings)
+        summary = json.dumps(classes)
+        file_metrics = json.dumps(metrics)
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, data, fingerprints, summary, file_metrics, len(data) + len(fingerprints) + len(summary) + len(file_metrics), self.now))
+
+    def file_digest(self, file_path):
+        stat = os.stat(file_path)
+        row = self.db.execute("SELECT mtime_ns, size, digest FROM files WHERE path = ?", (file_path,)).fetchone()
+        if row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            return row[2]
+
+        with open(file_path, 'rb') as file:
+            digest = hashlib.blake2b(file.read(), digest_size=20).hexdigest()
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (file_path, stat.st_mtime_ns, stat.st_size, digest))
+        return digest
+
+    def evict(self):
+        # Drop the least recently used findings until the cache fits in max_bytes again
+        total = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for key, nbytes in self.db.execute("SELECT key, nbytes FROM results ORDER BY used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= nbytes
+        self.db.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def close(self):
+        self.db.executemany("UPDATE results SET used = ? WHERE key = ?", ((self.now, key) for key in self.used_keys))
+        self.evict()
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,60 @@
+import io
+import tokenize
+import unittest
+
+from clone_detection import CloneIndex, fingerprint_tokens
+
+FUNCTION = '''def {name}(records, threshold):
+    results = []
+    for record in records:
+        if record.value > threshold:
+            total = record.value * 2 + record.offset
+            results.append((record.name, total))
+        elif record.value < 0:
+            results.append((record.name, -record.value))
+        else:
+            results.append((record.name, 0))
+    summary = {{}}
+    for name, total in results:
+        summary[name] = summary.get(name, 0) + total
+    ordered = sorted(summary.items(), key=lambda item: item[1])
+    return ordered
+'''
+
+
+def fingerprints(source):
+    return fingerprint_tokens(tokenize.generate_tokens(io.StringIO(source).readline))
+
+
+class FindClonesTest(unittest.TestCase):
+    def test_several_copies_in_one_file(self):
+        index = CloneIndex()
+        index.add('a.py', fingerprints(FUNCTION.format(name='process_records')))
+        index.add('b.py', fingerprints('\n\n'.join(FUNCTION.format(name=name) for name in ('first', 'second', 'third'))))
+
+        clones = index.find_clones()
+        self.assertEqual([(clone.path, clone.start, clone.original_path, clone.original_start) for clone in clones],
+                         [('b.py', 1, 'a.py', 1), ('b.py', 18, 'a.py', 1), ('b.py', 35, 'a.py', 1)])
+        self.assertEqual({clone.group_size for clone in clones}, {4})
+
+    def test_several_copies_in_the_file_of_the_original(self):
+        index = CloneIndex()
+        index.add('a.py', fingerprints('\n\n'.join(FUNCTION.format(name=name) for name in ('first', 'second', 'third'))))
+
+        clones = index.find_clones()
+        self.assertEqual([(clone.path, clone.start, clone.end, clone.original_start, clone.original_end, clone.group_size)
+                          for clone in clones],
+                         [('a.py', 18, 32, 1, 15, 3), ('a.py', 35, 49, 1, 15, 3)])
+
+    def test_matches_of_other_alignments_are_not_merged(self):
+        index = CloneIndex()
+        index.add('a.py', fingerprints(FUNCTION.format(name='process_records')))
+        index.add('b.py', fingerprints(FUNCTION.format(name='copy')))
+
+        clones = index.find_clones()
+        self.assertEqual([(clone.start, clone.end, clone.original_start, clone.original_end) for clone in clones],
+                         [(1, 15, 1, 15)])
+
+
+if __name__ == '__main__':
+    unittest.main()
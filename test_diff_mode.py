@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'code_smells_detection.py')
+
+
+def git(directory, *args):
+    subprocess.run(['git', '-C', directory, '-c', 'user.name=test', '-c', 'user.email=test@example.com', *args],
+                   check=True, capture_output=True)
+
+
+class DiffModeTest(unittest.TestCase):
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.root = temporary.name
+        self.repo = os.path.join(self.root, 'repo')
+        os.mkdir(self.repo)
+        git(self.repo, 'init', '-q')
+        with open(os.path.join(self.repo, 'module.py'), 'w', encoding='utf-8') as file:
+            file.write("def handler(event):\n    return event.body\n")
+        git(self.repo, 'add', 'module.py')
+        git(self.repo, 'commit', '-q', '-m', 'base')
+        with open(os.path.join(self.repo, 'module.py'), 'a', encoding='utf-8') as file:
+            file.write("\n\ndef scaled(value):\n    return value * 42\n")
+
+    def scan(self, directory):
+        return subprocess.run([sys.executable, SCRIPT, directory, '--diff', 'HEAD', '--select', 'MAGIC_NUMBER'],
+                              capture_output=True, text=True)
+
+    def test_reports_changed_lines(self):
+        result = self.scan(self.repo)
+        self.assertIn("Total code smells detected: 1", result.stdout)
+        self.assertEqual(result.returncode, 1)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), "needs symlinks")
+    def test_directory_through_symlink(self):
+        link = os.path.join(self.root, 'link')
+        os.symlink(self.repo, link)
+        result = self.scan(link)
+        self.assertIn("Total code smells detected: 1", result.stdout)
+        self.assertEqual(result.returncode, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
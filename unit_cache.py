@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+# Units kept before the least recently used ones are dropped; a unit takes a few hundred bytes
+DEFAULT_MAX_UNITS = 100000
+
+# What analyzing one top-level function or class produces, with lines relative to its first line:
+#   findings: (group, depth, rule, line, column, symbol, metrics) of the tree rules, in walk order
+#   complexity: (kind, line, column, name, complexity) of radon's blocks, kind 0 for functions and 1 for classes and methods
+#   functions, classes: (depth, name, line, *metrics) rows for metrics_report.FileMetrics, empty unless metrics are collected
+#   error: why radon failed on the unit, or None
+UnitResult = namedtuple('UnitResult', 'findings complexity functions classes error')
+
+
+def unit_key(source):
+    # The source of a unit holds no absolute position, so a unit that only moved keeps its key
+    return hashlib.blake2b(source.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+class UnitCache:
+    """Least recently used results of single functions and classes, keyed by the hash of their source.
+
+    A file that changed is still analyzed one unit at a time, so only the units that were edited are
+    analyzed again. The cache belongs to one detector configuration; save() and load() keep it across
+    runs in one JSON file, which is ignored once the configuration changes.
+    """
+
+    def __init__(self, config_key, max_units=DEFAULT_MAX_UNITS):
+        self.config_key = config_key
+        self.max_units = max_units
+        self.units = OrderedDict()
+        self.changed = False
+        # The (key, UnitResult) pairs put since it was last emptied, when it is a list; pool workers send them back
+        self.added = None
+
+    def get(self, key):
+        result = self.units.get(key)
+        if result is not None:
+            self.units.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.units[key] = result
+        self.changed = True
+        if self.added is not None:
+            self.added.append((key, result))
+        while len(self.units) > self.max_units:
+            self.units.popitem(last=False)
+
+    @classmethod
+    def load(cls, path, config_key, max_units=DEFAULT_MAX_UNITS):
+        """The cache saved at path, or an empty one when there is none or it was made with another configuration."""
+        cache = cls(config_key, max_units)
+        try:
+            with open(path, encoding='utf-8') as file:
+                document = json.load(file)
+        except (OSError, ValueError):
+            return cache
+        if document.get('config_key') == config_key:
+            # Tuples came back as lists; findings turn their metrics back into tuples when they are rebuilt
+            cache.units.update((key, UnitResult(*row)) for key, row in document['units'][-max_units:])
+        return cache
+
+    def save(self, path):
+        """Write the cache to path, least recently used first, if anything was added since it was loaded."""
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(path) or os.curdir, exist_ok=True)
+        # Write then rename, so a scan running at the same time never reads half a file
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump({'config_key': self.config_key, 'units': list(self.units.items())}, file)
+        os.replace(temporary, path)
+        self.changed = False
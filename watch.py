@@ -0,0 +1,361 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+from class_hierarchy import ClassHierarchy
+from clone_detection import CloneIndex
+from code_smells_detection import clone_finding, hierarchy_findings
+
+# How long to keep collecting events after the first one, so an editor's save is handled as one change
+DEBOUNCE_SECONDS = 0.05
+
+# How often the stat poller looks at the tree when inotify is not available
+POLL_SECONDS = 0.5
+
+# inotify flags, from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class StatPoller:
+    """Finds changed files by comparing mtime and size of every Python file between polls."""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for file_path in self.detector.find_python_files():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        """Return the paths added, changed or removed since the last call, waiting up to timeout for some."""
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self.take_snapshot()
+            dirty = {path for path, stat in snapshot.items() if self.snapshot.get(path) != stat}
+            dirty.update(path for path in self.snapshot if path not in snapshot)
+            self.snapshot = snapshot
+            if dirty or time.monotonic() >= deadline:
+                return dirty
+            time.sleep(min(POLL_SECONDS, max(0.0, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Finds changed files from Linux inotify events, watching every directory under the scanned one."""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        # Pruned directories such as virtualenvs are not watched at all
+        for directory in detector.file_finder.directories():
+            self.add_watch(directory)
+
+    def add_watch(self, directory):
+        descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if descriptor < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.directories[descriptor] = directory
+
+    def wait(self, timeout):
+        dirty = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            dirty.update(self.read_events())
+            ready, _, _ = select.select([self.fd], [], [], DEBOUNCE_SECONDS)
+        return dirty
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+
+            directory = self.directories.get(descriptor)
+            if directory is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                del self.directories[descriptor]
+                yield directory
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # A new directory may already hold files by the time its watch is in place
+                    for root, dirs, files in os.walk(path):
+                        dirs[:] = [name for name in dirs if name not in self.detector.file_finder.excluded_dirs]
+                        self.add_watch(root)
+                        yield from (os.path.join(root, file) for file in files)
+                else:
+                    yield path
+            elif path.endswith('.py'):
+                yield path
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(detector):
+    # inotify is Linux only, and can run out of watches on very large trees
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(detector)
+        except OSError:
+            pass
+    return StatPoller(detector)
+
+
+class WatchSession:
+    """Keeps the findings of every file in memory and re-analyzes only the files that change."""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.results = {}
+        self.hierarchy = ClassHierarchy(detector.directory)
+        self.class_findings = []
+        self.clones = []
+        # Whether a change since the last cross-file pass touched classes or fingerprints
+        self.hierarchy_stale = False
+        self.clones_stale = False
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def full_scan(self):
+        file_paths = list(self.detector.find_python_files())
+        for file_path, result in zip(file_paths, self.detector.iter_file_results(file_paths)):
+            self.results[file_path] = result
+            self.hierarchy.update(file_path, result.classes)
+        self.hierarchy_stale = self.clones_stale = True
+        self.update_cross_file()
+
+    def update_cross_file(self):
+        """Recompute class hierarchy findings and clones if a change touched what they are made of."""
+        if self.hierarchy_stale:
+            self.class_findings = hierarchy_findings(self.hierarchy, self.detector.rules.thresholds)
+        if self.clones_stale:
+            self.clones = self.find_clones()
+        changed = self.hierarchy_stale or self.clones_stale
+        self.hierarchy_stale = self.clones_stale = False
+        return changed
+
+    def find_clones(self):
+        clone_index = CloneIndex()
+        for file_path, result in self.results.items():
+            clone_index.add(file_path, result.fingerprints)
+        return [clone_finding(clone) for clone in clone_index.find_clones()]
+
+    def update(self, dirty_paths):
+        """Re-analyze changed files and drop removed ones; return the events describing the change."""
+        events = []
+        for path in sorted(dirty_paths):
+            if os.path.isfile(path) and self.detector.file_finder.matches(path):
+                result = self.detector.analyze(path)
+                previous = self.results.get(path)
+                # Most edits leave the classes alone, and edits to comments or blank lines the fingerprints too
+                if previous is None or previous.classes != result.classes:
+                    self.hierarchy.update(path, result.classes)
+                    self.hierarchy_stale = True
+                if previous is None or previous.fingerprints != result.fingerprints:
+                    self.clones_stale = True
+                self.results[path] = result
+                events.append(file_event(path, result.findings))
+            elif path in self.results:
+                self.remove(path)
+                events.append(file_event(path, [], deleted=True))
+            else:
+                # A removed directory takes all of its files with it
+                prefix = path.rstrip(os.sep) + os.sep
+                for removed in [known for known in self.results if known.startswith(prefix)]:
+                    self.remove(removed)
+                    events.append(file_event(removed, [], deleted=True))
+        return events
+
+    def remove(self, path):
+        del self.results[path]
+        self.hierarchy.remove(path)
+        self.hierarchy_stale = self.clones_stale = True
+
+    def snapshot_events(self):
+        events = [file_event(path, result.findings) for path, result in self.results.items()]
+        events.append(hierarchy_event(self.class_findings))
+        events.append(clones_event(self.clones))
+        events.append(self.summary_event(0.0))
+        return events
+
+    def summary_event(self, seconds):
+        total = sum(len(result.findings) for result in self.results.values()) + len(self.class_findings) + len(self.clones)
+        return {'type': 'summary', 'files': len(self.results), 'smells': total, 'seconds': seconds}
+
+    def subscribe(self, connection):
+        # New subscribers start from the full picture, then get every change
+        with self.lock:
+            send_events(connection, self.snapshot_events())
+            self.subscribers.append(connection)
+
+    def publish(self, events):
+        with self.lock:
+            for connection in list(self.subscribers):
+                try:
+                    send_events(connection, events)
+                except OSError:
+                    self.subscribers.remove(connection)
+                    connection.close()
+
+    def run(self, watcher, output=sys.stdout):
+        """Watch forever, printing each change to output and pushing it to socket subscribers."""
+        files = 0
+        elapsed = 0.0
+        while True:
+            # While changes are pending, only wait for the next one as long as an editor's save takes
+            dirty = watcher.wait(timeout=DEBOUNCE_SECONDS if files else 1.0)
+            if dirty:
+                start = time.perf_counter()
+                with self.lock:
+                    events = self.update(dirty)
+                elapsed += time.perf_counter() - start
+                if events:
+                    files += len(events)
+                    self.publish(events)
+                    print_events(events, output)
+                continue
+            if not files:
+                continue
+
+            # Class hierarchies and clones span files, so they are recomputed once a burst of changes is over,
+            # after the per-file results are already out, and only if the changes touched classes or fingerprints
+            start = time.perf_counter()
+            with self.lock:
+                cross_file = self.update_cross_file()
+            elapsed += time.perf_counter() - start
+            summary = self.summary_event(elapsed)
+            events = [hierarchy_event(self.class_findings), clones_event(self.clones)] if cross_file else []
+            self.publish(events + [summary])
+            print(f"[watch] {files} file(s) re-analyzed in {elapsed * 1000:.0f} ms, "
+                  f"{summary['smells']} smells in {summary['files']} files", file=output, flush=True)
+            files = 0
+            elapsed = 0.0
+
+
+def file_event(path, findings, deleted=False):
+    return {'type': 'file', 'path': path, 'deleted': deleted, 'findings': [finding.to_json() for finding in findings]}
+
+
+def hierarchy_event(findings):
+    return {'type': 'hierarchy', 'findings': [finding.to_json() for finding in findings]}
+
+
+def clones_event(clones):
+    return {'type': 'clones', 'findings': [finding.to_json() for finding in clones]}
+
+
+def send_events(connection, events):
+    connection.sendall(''.join(json.dumps(event) + '\n' for event in events).encode('utf-8'))
+
+
+def print_events(events, output):
+    for event in events:
+        if event['deleted']:
+            print(f"[watch] removed {event['path']}", file=output)
+            continue
+        print(f"[watch] {event['path']}: {len(event['findings'])} smells", file=output)
+        for finding in event['findings']:
+            print(f"  {finding['message']}", file=output)
+    output.flush()
+
+
+def parse_address(address):
+    """'host:port' is a TCP address, anything else is the path of a Unix socket."""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+def serve_subscribers(session, address):
+    """Accept subscribers on a local socket in a background thread."""
+    family, bind_address = parse_address(address)
+    server = socket.socket(family, socket.SOCK_STREAM)
+    if family == socket.AF_UNIX and os.path.exists(bind_address):
+        os.unlink(bind_address)
+    elif family == socket.AF_INET:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(bind_address)
+    server.listen()
+
+    def accept_loop():
+        while True:
+            connection, _ = server.accept()
+            try:
+                session.subscribe(connection)
+            except OSError:
+                connection.close()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server
+
+
+def subscribe(address):
+    """Connect to a watch session and yield its events as they arrive."""
+    family, connect_address = parse_address(address)
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.connect(connect_address)
+        with connection.makefile('r', encoding='utf-8') as stream:
+            for line in stream:
+                yield json.loads(line)
+
+
+def watch(detector, address=None, output=sys.stdout):
+    session = WatchSession(detector)
+    start = time.perf_counter()
+    session.full_scan()
+    summary = session.summary_event(time.perf_counter() - start)
+    print(f"[watch] initial scan: {summary['smells']} smells in {summary['files']} files "
+          f"({summary['seconds']:.1f}s), watching {detector.directory}", file=output, flush=True)
+
+    if address is not None:
+        serve_subscribers(session, address)
+        print(f"[watch] publishing updates on {address}", file=output, flush=True)
+
+    watcher = make_watcher(detector)
+    try:
+        session.run(watcher, output)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+        # Like a scan, keep the units analyzed during the session for the next run
+        detector.save_units()